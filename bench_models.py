@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+"""
+Arrival Model Microbenchmark
+============================
+Parse throughput and memory per arrival for a city-wide snapshot.
+
+Compares three ways of holding the same decoded getStopArrivals responses:
+  - legacy:  plain dataclass, chained data.get(a, data.get(b)) per field
+  - objects: BusArrival.from_api_list (slots, interned strings, one key lookup)
+  - batch:   one ArrivalBatch for the whole sweep (columns plus a string table)
+
+Usage:
+    python bench_models.py
+    python bench_models.py --stops 3000 --per-stop 10
+"""
+
+import argparse
+import gc
+import json
+import random
+import time
+import tracemalloc
+from dataclasses import dataclass
+
+from core.models import ArrivalBatch, BusArrival
+
+LINES = [
+    ("01", "Κ.Τ.Ε.Λ. - ΝΕΟΣ ΣΙΔΗΡΟΔΡΟΜΙΚΟΣ ΣΤΑΘΜΟΣ - Ι.Κ.Ε.Λ."),
+    ("02", "ΝΕΟΣ ΣΙΔΗΡΟΔΡΟΜΙΚΟΣ ΣΤΑΘΜΟΣ - ΒΟΥΛΓΑΡΗ"),
+    ("31", "ΝΕΟΣ ΣΙΔΗΡΟΔΡΟΜΙΚΟΣ ΣΤΑΘΜΟΣ - ΔΗΜΟΚΡΑΤΙΑΣ - ΠΑΝΕΠΙΣΤΗΜΙΟ"),
+    ("10", "ΧΑΡΙΛΑΟΥ - ΠΛ. ΑΡΙΣΤΟΤΕΛΟΥΣ"),
+    ("12", "Κ.Τ.Ε.Λ. - ΝΕΑ ΠΑΡΑΛΙΑ - ΙΚΕΑ"),
+    ("78", "ΑΕΡΟΔΡΟΜΙΟ - ΙΚΕΑ - ΝΕΟΣ ΣΙΔ. ΣΤΑΘΜΟΣ"),
+    ("52", "Κ.Τ.Ε.Λ. - ΠΛΑΓΙΑΡΙ"),
+    ("2K", "ΚΟΥΦΑΛΙΑ - ΝΕΟΣ ΣΙΔΗΡΟΔΡΟΜΙΚΟΣ ΣΤΑΘΜΟΣ"),
+]
+
+
+@dataclass
+class LegacyArrival:
+    """BusArrival as it was before slots and interning"""
+    line_id: str
+    line_descr: str
+    route_code: str
+    vehicle_code: str
+    estimated_minutes: int
+    fetched_at: float = 0.0
+    stale: bool = False
+
+    @classmethod
+    def from_api(cls, data: dict, fetched_at: float = 0.0) -> 'LegacyArrival':
+        return cls(
+            line_id=data.get('bline_id', data.get('line_id', '')),
+            line_descr=data.get('bline_descr', data.get('line_descr', '')),
+            route_code=data.get('route_code', ''),
+            vehicle_code=data.get('veh_code', ''),
+            estimated_minutes=int(data.get('btime2', data.get('estimated_time', 0))),
+            fetched_at=fetched_at
+        )
+
+
+def make_snapshot(stops: int, per_stop: int, seed: int = 1) -> list:
+    """Decoded responses, one list per stop, as json.loads would produce them"""
+    rng = random.Random(seed)
+    responses = []
+    for _ in range(stops):
+        records = []
+        for _ in range(per_stop):
+            line_id, descr = rng.choice(LINES)
+            records.append({
+                "bline_id": line_id, "bline_descr": descr,
+                "route_code": str(rng.randint(1, 400)),
+                "veh_code": str(rng.randint(1000, 2999)),
+                "btime2": str(rng.randint(1, 40)),
+            })
+        responses.append(records)
+    # Round-trip so every record has its own string objects, like a real response
+    return [json.loads(json.dumps(r, ensure_ascii=False)) for r in responses]
+
+
+def parse_batch(snapshot: list) -> ArrivalBatch:
+    batch = ArrivalBatch(1.0)
+    for items in snapshot:
+        batch.extend(items)
+    return batch
+
+
+PARSERS = {
+    'legacy': lambda snapshot: [[LegacyArrival.from_api(d, 1.0) for d in items]
+                                for items in snapshot],
+    'objects': lambda snapshot: [BusArrival.from_api_list(items, 1.0) for items in snapshot],
+    'batch': parse_batch,
+}
+
+
+def throughput(parse, snapshot: list, total: int, repeat: int) -> float:
+    """Best-of-repeat arrivals parsed per second"""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        parse(snapshot)
+        best = min(best, time.perf_counter() - start)
+    return total / best
+
+
+def bytes_per_arrival(parse, stops: int, per_stop: int, total: int) -> float:
+    """Memory retained by the parsed snapshot, once the raw responses are freed"""
+    snapshot = make_snapshot(stops, per_stop)
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    parsed = parse(snapshot)
+    del snapshot
+    gc.collect()
+    retained = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    del parsed
+    return retained / total
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[3])
+    parser.add_argument('--stops', type=int, default=2000)
+    parser.add_argument('--per-stop', type=int, default=8)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    total = args.stops * args.per_stop
+    snapshot = make_snapshot(args.stops, args.per_stop)
+    print(f"{args.stops} stops x {args.per_stop} arrivals = {total} arrivals\n")
+    print(f"{'':8} {'arrivals/s':>12} {'bytes/arrival':>14}")
+
+    results = {}
+    for name, parse in PARSERS.items():
+        rate = throughput(parse, snapshot, total, args.repeat)
+        size = bytes_per_arrival(parse, args.stops, args.per_stop, total)
+        results[name] = (rate, size)
+        print(f"{name:8} {rate:12,.0f} {size:14.1f}")
+
+    base_rate, base_size = results['legacy']
+    print()
+    for name in ('objects', 'batch'):
+        rate, size = results[name]
+        print(f"{name}: {rate / base_rate:.2f}x parse throughput, "
+              f"{base_size / size:.1f}x less memory than legacy")
+
+
+if __name__ == "__main__":
+    main()
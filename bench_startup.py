@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+CLI Startup Benchmark
+=====================
+Measures wall time of `cli.py --stop X --format plain` when the answer is
+served from the arrivals cache, which is what conky pays every minute.
+
+Runs the CLI in a throwaway cache directory seeded with one entry, then
+reports the median wall time over a bare `python -c pass` against
+TARGET_OVERHEAD_MS, so the gate does not depend on how fast the machine
+starts an interpreter, and the slowest imports from `python -X importtime`.
+
+Usage:
+    python bench_startup.py
+    python bench_startup.py --runs 50 --top 15
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent
+STOP_CODE = "3344"
+TARGET_OVERHEAD_MS = 80  # Median time a cache hit may add to `python -c pass`
+
+# Modules that must not be loaded on the cache-hit path
+FORBIDDEN = ['requests', 'urllib3', 'playwright', 'asyncio', 'sqlite3']
+
+SAMPLE = [
+    {"bline_id": "01", "bline_descr": "", "route_code": "39", "veh_code": "2740", "btime2": "5"},
+    {"bline_id": "31", "bline_descr": "", "route_code": "92", "veh_code": "1712", "btime2": "12"},
+]
+
+
+def seed_cache(env: dict):
+    """Write a fresh cache entry for STOP_CODE using the CLI's own cache code"""
+    code = (
+        "import json, sys; from core.cache import ArrivalCache; "
+        f"ArrivalCache().write({STOP_CODE!r}, json.loads(sys.argv[1]))"
+    )
+    import json
+    subprocess.run([sys.executable, '-c', code, json.dumps(SAMPLE)],
+                   cwd=ROOT, env=env, check=True)
+
+
+def run_cli(env: dict, importtime: bool = False) -> subprocess.CompletedProcess:
+    cmd = [sys.executable]
+    if importtime:
+        cmd += ['-X', 'importtime']
+    cmd += ['cli.py', '--stop', STOP_CODE, '--format', 'plain', '--cache-ttl', '3600']
+    return subprocess.run(cmd, cwd=ROOT, env=env, capture_output=True, text=True)
+
+
+def parse_importtime(stderr: str):
+    """Yield (cumulative_us, module) from -X importtime output"""
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        yield int(cumulative_us), name.rstrip()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[3])
+    parser.add_argument('--runs', type=int, default=20)
+    parser.add_argument('--top', type=int, default=10)
+    parser.add_argument('--target', type=float, default=TARGET_OVERHEAD_MS,
+                        help='Median time over a bare interpreter to pass, in ms')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(os.environ, XDG_CACHE_HOME=tmp, XDG_RUNTIME_DIR=tmp)
+        seed_cache(env)
+
+        # Baseline: the interpreter alone
+        times = []
+        for _ in range(args.runs):
+            start = time.perf_counter()
+            subprocess.run([sys.executable, '-c', 'pass'], check=True)
+            times.append((time.perf_counter() - start) * 1000)
+        baseline = statistics.median(times)
+
+        times = []
+        for _ in range(args.runs):
+            start = time.perf_counter()
+            result = run_cli(env)
+            times.append((time.perf_counter() - start) * 1000)
+            if result.returncode != 0:
+                print(result.stderr, file=sys.stderr)
+                sys.exit(1)
+        median = statistics.median(times)
+
+        result = run_cli(env, importtime=True)
+
+    imports = sorted(parse_importtime(result.stderr), reverse=True)
+    loaded = {name.strip() for _, name in imports}
+
+    print(f"python -c pass:  {baseline:6.1f} ms (median of {args.runs})")
+    overhead = median - baseline
+    print(f"cli.py cache hit: {median:6.1f} ms (median of {args.runs})")
+    print(f"overhead:         {overhead:6.1f} ms (target {args.target:.0f} ms)")
+    print("\nSlowest imports (cumulative):")
+    for cumulative_us, name in imports[:args.top]:
+        print(f"  {cumulative_us / 1000:7.1f} ms  {name}")
+
+    leaked = [m for m in FORBIDDEN if m in loaded]
+    if leaked:
+        print(f"\n❌ Loaded on the cache-hit path: {', '.join(leaked)}")
+    if overhead > args.target:
+        print(f"\n❌ Over target by {overhead - args.target:.1f} ms")
+    if leaked or overhead > args.target:
+        sys.exit(1)
+    print("\n✅ Within target")
+
+
+if __name__ == "__main__":
+    main()
@@ -7,15 +7,29 @@ Command-line interface for getting bus arrivals.
 Usage:
     python cli.py --stop 3344
     python cli.py --stop 3344 --format json
+    python cli.py --stop 3344 --watch
     python cli.py --lines
+    python cli.py --serve
+    python cli.py --search "ΒΟΣΠ"
+    python cli.py --near 40.6329,22.9416
+    python cli.py --config boards.toml
+    cut -f1 stops.tsv | python cli.py --batch
+    python cli.py --monitor --budget 120 < stops.txt
 """
 
 import argparse
 import json
+import os
 import sys
-from typing import List
+import time
+from typing import List, Tuple
 
-from core import OasthAPI, BusArrival, get_arrivals
+# Keep imports light: conky runs this every minute and a cache hit must
+# not load requests or the session machinery (see bench_startup.py).
+from core.models import BusArrival, BusStop, StreetStop
+from core.cache import ArrivalCache, MetadataCache
+from core.lookup import enrich_arrivals
+from core.watch import DEFAULT_HORIZON, project
 
 # ANSI Colors
 R = '\033[0m'       # Reset
@@ -26,13 +40,15 @@ CYAN = '\033[96m'   # Cyan
 GREY = '\033[90m'   # Grey
 
 
-def format_ansi(arrivals: List[BusArrival], stop_code: str, stop_name: str = "") -> str:
+def format_ansi(arrivals: List[BusArrival], stop_code: str, stop_name: str = "",
+                max_times: int = 2) -> str:
     """Format arrivals with ANSI colors for terminal"""
     lines = []
     
     # Header
     header = f"{CYAN}{stop_name}{R}" if stop_name else ""
     header += f" {GREY}{stop_code}{R}" if stop_code else ""
+    header += f" {GREY}(cached){R}" if any(a.stale for a in arrivals) else ""
     lines.append(header.strip())
     lines.append(f"{GREY}{'─' * 25}{R}")
     
@@ -51,7 +67,7 @@ def format_ansi(arrivals: List[BusArrival], stop_code: str, stop_name: str = "")
     sorted_lines = sorted(by_line.items(), key=lambda x: min(x[1]))
     
     for line_id, times in sorted_lines:
-        times = sorted(times)[:2]  # Max 2 times per line
+        times = sorted(times)[:max_times]
         
         line_padded = f"{line_id:<5}"
         
@@ -66,17 +82,23 @@ def format_ansi(arrivals: List[BusArrival], stop_code: str, stop_name: str = "")
     return "\n".join(lines)
 
 
+def arrival_to_json(a: BusArrival) -> dict:
+    """JSON-ready fields of one arrival"""
+    enrich_arrivals([a])  # Names from local files, never a request
+    return {
+        "line": a.line_id,
+        "description": a.line_descr,
+        "route": a.route_descr,
+        "minutes": a.estimated_minutes,
+        "vehicle": a.vehicle_code,
+        "fetched_at": a.fetched_at,
+        "stale": a.stale
+    }
+
+
 def format_json(arrivals: List[BusArrival]) -> str:
     """Format arrivals as JSON"""
-    data = [
-        {
-            "line": a.line_id,
-            "description": a.line_descr,
-            "minutes": a.estimated_minutes,
-            "vehicle": a.vehicle_code
-        }
-        for a in arrivals
-    ]
+    data = [arrival_to_json(a) for a in arrivals]
     return json.dumps(data, indent=2, ensure_ascii=False)
 
 
@@ -91,6 +113,254 @@ def format_plain(arrivals: List[BusArrival]) -> str:
     return "\n".join(lines)
 
 
+def format_stops(stops: List[StreetStop], fmt: str = 'ansi') -> str:
+    """Format stop search results"""
+    if fmt == 'json':
+        data = [
+            {
+                "street_id": s.street_id,
+                "name": s.stop_descr,
+                "api_ids": s.api_ids
+            }
+            for s in stops
+        ]
+        return json.dumps(data, indent=2, ensure_ascii=False)
+    
+    if not stops:
+        return "No stops found"
+    
+    lines = []
+    for s in stops:
+        ids = ", ".join(s.api_ids)
+        if fmt == 'plain':
+            lines.append(f"{s.street_id}: {s.stop_descr} (API {ids})")
+        else:
+            lines.append(f" {AMBER}{s.street_id:<6}{R} {CYAN}{s.stop_descr}{R} {GREY}API {ids}{R}")
+    return "\n".join(lines)
+
+
+def format_nearby(found: List[Tuple[BusStop, float]], fmt: str = 'ansi') -> str:
+    """Format (stop, distance) pairs from a location query"""
+    if fmt == 'json':
+        data = [
+            {
+                "stop_code": s.stop_code,
+                "name": s.stop_descr,
+                "lat": s.stop_lat,
+                "lng": s.stop_lng,
+                "distance_m": round(d)
+            }
+            for s, d in found
+        ]
+        return json.dumps(data, indent=2, ensure_ascii=False)
+    
+    if not found:
+        return "No stops nearby"
+    
+    lines = []
+    for s, d in found:
+        if fmt == 'plain':
+            lines.append(f"{s.stop_code}: {s.stop_descr} ({d:.0f} m)")
+        else:
+            lines.append(f" {AMBER}{s.stop_code:<6}{R} {CYAN}{s.stop_descr}{R} {GREY}{d:.0f} m{R}")
+    return "\n".join(lines)
+
+
+class DiffPainter:
+    """Repaints only the terminal rows that changed since the last frame"""
+    
+    def __init__(self, out=sys.stdout):
+        self.out = out
+        self.rows: List[str] = []
+    
+    def paint(self, rows: List[str]):
+        w = self.out.write
+        height = len(self.rows)
+        
+        for i, row in enumerate(rows):
+            if i < height and self.rows[i] == row:
+                continue
+            up = height - i
+            if up > 0:
+                w(f"\033[{up}A\r\033[2K{row}\033[{up}B\r")  # Rewrite in place
+            else:
+                w(f"\033[2K{row}\n")  # Grow the frame
+                height += 1
+        
+        # Blank rows left over from a taller previous frame
+        for i in range(len(rows), len(self.rows)):
+            up = height - i
+            w(f"\033[{up}A\r\033[2K\033[{up}B\r")
+        
+        self.rows = rows + [''] * (len(self.rows) - len(rows))
+        self.out.flush()
+
+
+def release_stdout():
+    """
+    Flush stdout and point it at /dev/null, so a reader waiting for EOF
+    (conky's execpi, shell $(...)) is not held up by a background cache
+    refresh that keeps the process alive after the output is printed.
+    """
+    try:
+        sys.stdout.flush()
+    except BrokenPipeError:
+        pass
+    os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+
+
+def run_watch(args, fetch, stop_code: str, stop_name: str):
+    """Keep a board on screen, polling adaptively and counting down locally"""
+    from core.watch import MIN_INTERVAL, POLL_MAX_AGE, poll_interval, project
+    
+    painter = DiffPainter()
+    arrivals: List[BusArrival] = []
+    fetched_at = 0.0
+    next_poll = 0.0
+    error = ""
+    
+    sys.stdout.write("\033[?25l")  # Hide cursor
+    try:
+        while True:
+            now = time.time()
+            if now >= next_poll:
+                try:
+                    arrivals = fetch(POLL_MAX_AGE)
+                    fetched_at = min((a.fetched_at for a in arrivals if a.fetched_at), default=now)
+                    error = ""
+                    # Count from the data's age, but a stale board (served from
+                    # cache after a failed fetch) must not be re-polled at once
+                    next_poll = max(now + MIN_INTERVAL,
+                                    fetched_at + poll_interval(arrivals, args.horizon))
+                except Exception as e:
+                    error = str(e)[:40]
+                    next_poll = now + 30
+            
+            shown = project(arrivals, now)
+            rows = format_ansi(shown, stop_code, stop_name, args.max_times).split("\n")
+            status = f"updated {now - fetched_at:.0f}s ago, next in {max(0, next_poll - now):.0f}s"
+            if error:
+                status = f"{NEON_R}{error}{R} {GREY}{status}"
+            rows.append(f"{GREY}{status}{R}")
+            painter.paint(rows)
+            
+            # Wake on the next whole second, or sooner for a due poll
+            time.sleep(max(0.05, min(next_poll - time.time(), 1 - time.time() % 1)))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        sys.stdout.write("\033[?25h\n")  # Restore cursor
+        sys.stdout.flush()
+
+
+def run_batch(args):
+    """Stream one JSON line per stop code read from stdin"""
+    from core.api import OasthAPI
+    from core.batch import stream_arrivals
+    
+    codes = (
+        line.strip() for line in sys.stdin
+        if line.strip() and not line.lstrip().startswith('#')
+    )
+    cache = ArrivalCache(ttl=args.horizon) if args.horizon > 0 else None
+    
+    api = OasthAPI(cache=cache, pool_size=args.concurrency)
+    try:
+        for result in stream_arrivals(codes, api, args.concurrency):
+            record = {"stop": result.stop_code, "ts": round(result.fetched_at, 3)}
+            if result.error is not None:
+                record["error"] = f"{type(result.error).__name__}: {result.error}"
+            else:
+                record["arrivals"] = [arrival_to_json(a) for a in result.arrivals]
+            sys.stdout.write(json.dumps(record, ensure_ascii=False, separators=(',', ':')) + "\n")
+            sys.stdout.flush()
+    except BrokenPipeError:
+        # Downstream stage (e.g. `head`) closed the pipe: point stdout at
+        # /dev/null so the flush at exit does not fail again, and stop
+        release_stdout()
+        sys.exit(1)
+
+
+def run_monitor(args):
+    """Poll the stop codes read from stdin under a request budget"""
+    import threading
+    from dataclasses import asdict
+    from core.api import OasthAPI
+    from core.scheduler import PollScheduler
+    
+    out = threading.Lock()
+    
+    def emit(state):
+        record = {"stop": state.stop_code, "ts": round(time.time(), 3)}
+        if state.last_error is not None:
+            record["error"] = f"{type(state.last_error).__name__}: {state.last_error}"
+        else:
+            record["arrivals"] = [arrival_to_json(a) for a in state.arrivals]
+        with out:
+            sys.stdout.write(json.dumps(record, ensure_ascii=False, separators=(',', ':')) + "\n")
+            sys.stdout.flush()
+    
+    def report():
+        with out:
+            print(json.dumps({"report": asdict(scheduler.report())}), file=sys.stderr)
+    
+    cache = ArrivalCache(ttl=args.horizon) if args.horizon > 0 else None
+    api = OasthAPI(cache=cache, pool_size=args.concurrency)
+    scheduler = PollScheduler(api, budget=args.budget, workers=args.concurrency, on_update=emit)
+    for line in sys.stdin:
+        fields = line.split('#', 1)[0].split()
+        if fields:
+            scheduler.add(fields[0], float(fields[1]) if len(fields) > 1 else 1.0)
+    
+    scheduler.start()
+    try:
+        while True:
+            time.sleep(60)
+            report()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        scheduler.stop()
+        report()
+
+
+def render_boards(args):
+    """Fetch and print every board of a --config file"""
+    from core.api import OasthAPI
+    from core.boards import load_boards, fetch_boards
+    
+    boards = load_boards(args.config)
+    if args.board:
+        wanted = set(args.board)
+        boards = [b for b in boards if b.key in wanted or b.name in wanted]
+        if not boards:
+            print(f"No board named {', '.join(args.board)}", file=sys.stderr)
+            sys.exit(1)
+    
+    cache = ArrivalCache(ttl=args.horizon) if args.horizon > 0 else None
+    api = OasthAPI(cache=cache, pool_size=args.concurrency)
+    results, errors = fetch_boards(boards, api=api, concurrency=args.concurrency)
+    results = {key: project(arrivals) for key, arrivals in results.items()}
+    for code, err in errors.items():
+        print(f"Stop {code}: {err}", file=sys.stderr)
+    
+    if args.format == 'json':
+        data = {
+            b.name: json.loads(format_json(results[b.key]))
+            for b in boards
+        }
+        print(json.dumps(data, indent=2, ensure_ascii=False))
+        return
+    
+    blocks = []
+    for b in boards:
+        if args.format == 'plain':
+            blocks.append(f"{b.name}\n{format_plain(results[b.key])}")
+        else:
+            blocks.append(format_ansi(results[b.key], ",".join(b.stops), b.name, b.max_times))
+    print("\n\n".join(blocks))
+
+
 def main():
     parser = argparse.ArgumentParser(
         description="OASTH Bus Arrival Widget",
@@ -99,17 +369,76 @@ def main():
 Examples:
   %(prog)s --stop 3344           Get arrivals for stop 3344
   %(prog)s --stop 3344 --json    Output as JSON
+  %(prog)s --stop 3344 --watch   Live board, only redraws what changed
+  %(prog)s --street 1403         Arrivals for a stop sign (all its codes)
   %(prog)s --lines               List all bus lines
-  %(prog)s --clear-cache         Clear session cache
+  %(prog)s --config boards.toml  Render every board in a config file
+  %(prog)s --batch < codes.txt   One JSON line per stop code on stdin
+  %(prog)s --monitor --budget 120 < codes.txt
+                                 Keep those stops fresh on 120 requests/min
+  %(prog)s --clear-cache         Clear session and response caches
+  %(prog)s --serve               Run the background daemon
+  %(prog)s --search "ΒΟΣΠ"        Find stop codes by name
+  %(prog)s --near 40.63,22.94    Closest stops to a location
+  %(prog)s --crawl-topology      Refresh lines/routes/stops assets from the API
         """
     )
     
     parser.add_argument('--stop', '-s', type=str, help='Stop code to query')
+    parser.add_argument('--street', type=str, metavar='ID',
+                        help='Street ID from the stop sign; merges all its stop codes')
     parser.add_argument('--stop-name', type=str, default='', help='Stop name for display')
+    parser.add_argument('--config', '-c', type=str, metavar='FILE',
+                        help='TOML file of named boards (see boards.example.toml)')
+    parser.add_argument('--board', '-b', action='append', metavar='NAME',
+                        help='With --config, only render these boards')
+    parser.add_argument('--batch', action='store_true',
+                        help='Read stop codes from stdin, write one JSON object per line')
+    parser.add_argument('--monitor', action='store_true',
+                        help='Keep polling the stop codes on stdin ("CODE [PRIORITY]" per line) '
+                             'within --budget')
+    parser.add_argument('--budget', type=float, default=60, metavar='RPM',
+                        help='Requests per minute --monitor may spend')
+    parser.add_argument('--concurrency', type=int, default=8,
+                        help='Requests in flight for --batch, --config, --monitor '
+                             'and --crawl-topology')
+    parser.add_argument('--watch', '-w', action='store_true',
+                        help='Keep the board on screen, refreshing it adaptively')
+    parser.add_argument('--max-times', type=int, default=2,
+                        help='Times shown per line')
     parser.add_argument('--format', '-f', choices=['ansi', 'json', 'plain'], 
                         default='ansi', help='Output format')
     parser.add_argument('--lines', action='store_true', help='List all bus lines')
-    parser.add_argument('--clear-cache', action='store_true', help='Clear session cache')
+    parser.add_argument('--search', type=str, metavar='QUERY',
+                        help='Search stops by name (Greek or Latin) or Street ID')
+    parser.add_argument('--near', type=str, metavar='LAT,LNG',
+                        help='List the stops closest to a location')
+    parser.add_argument('--radius', type=float, metavar='METRES',
+                        help='With --near, list every stop within this distance instead')
+    parser.add_argument('--limit', type=int, default=10, help='Maximum search results')
+    parser.add_argument('--clear-cache', action='store_true',
+                        help='Clear session, arrivals and line catalogue caches')
+    parser.add_argument('--crawl-topology', action='store_true',
+                        help='Walk lines -> routes -> stops (only changed routes after the '
+                             'first run) and regenerate lines/routes/stops.json')
+    parser.add_argument('--full', action='store_true',
+                        help='With --crawl-topology, re-fetch the stops of every route')
+    parser.add_argument('--assets-dir', type=str, metavar='DIR',
+                        help='With --crawl-topology, write the assets here instead of '
+                             'the bundled android/ assets')
+    parser.add_argument('--serve', action='store_true',
+                        help='Run a daemon that keeps the API client warm')
+    parser.add_argument('--no-daemon', action='store_true',
+                        help='Query the API directly even if the daemon is running')
+    parser.add_argument('--horizon', '--cache-ttl', type=float, default=DEFAULT_HORIZON,
+                        metavar='SECONDS',
+                        help='Seconds cached arrivals are counted down locally before '
+                             'a re-fetch is forced (0 disables the cache)')
+    parser.add_argument('--deadline', type=float, metavar='SECONDS',
+                        help='Answer within this time, hedging slow requests and '
+                             'falling back to the cached board')
+    parser.add_argument('--cache-stats', action='store_true',
+                        help="Show the daemon's cache, retry and circuit breaker counters")
     
     args = parser.parse_args()
     
@@ -117,24 +446,147 @@ Examples:
     if args.clear_cache:
         from core import clear_session_cache
         clear_session_cache()
-        print("Session cache cleared")
+        ArrivalCache().clear()
+        MetadataCache().clear()
+        print("Caches cleared")
+        return
+    
+    # Cache counters
+    if args.cache_stats:
+        from core.daemon_client import fetch_stats
+        stats = fetch_stats()
+        if stats is None:
+            print("Daemon not running", file=sys.stderr)
+            sys.exit(1)
+        print(json.dumps(stats, indent=2))
+        return
+    
+    # Regenerate the network assets
+    if args.crawl_topology:
+        from core.paths import ASSETS_DIR
+        from core.topology import refresh_topology
+        report = refresh_topology(assets_dir=args.assets_dir or ASSETS_DIR,
+                                  workers=args.concurrency, full=args.full)
+        print(f"{report.lines} lines, {report.routes} routes, {report.stops} stops "
+              f"in {report.elapsed:.1f}s")
+        print(f"Routes re-fetched: {report.routes_fetched}, unchanged: {report.routes_unchanged}")
+        print(f"Assets written: {', '.join(report.assets_written) or 'none (unchanged)'}")
+        for failure in report.failures:
+            print(f"Failed: {failure}", file=sys.stderr)
+        if report.failures:
+            sys.exit(1)
+        return
+    
+    # Run daemon
+    if args.serve:
+        from core.daemon import serve, SOCKET_PATH
+        print(f"Serving on {SOCKET_PATH}", file=sys.stderr)
+        serve()
+        return
+    
+    # Search stops
+    if args.search:
+        from core.stops import search_stops
+        print(format_stops(search_stops(args.search, args.limit), args.format))
+        return
+    
+    # Stops near a location
+    if args.near:
+        try:
+            lat, lng = (float(x) for x in args.near.split(','))
+        except ValueError:
+            parser.error("--near expects LAT,LNG")
+        from core.geo import load_geo_index, INDEX_FILE
+        if not INDEX_FILE.exists():
+            print("Building stop location index (one-off)...", file=sys.stderr)
+        index = load_geo_index()
+        if args.radius:
+            found = index.within(lat, lng, args.radius)[:args.limit]
+        else:
+            found = index.nearest(lat, lng, args.limit)
+        print(format_nearby(found, args.format))
         return
     
     # List lines
     if args.lines:
-        api = OasthAPI()
-        lines = api.get_lines()
-        for line in lines[:20]:  # First 20
-            print(f"{line.line_id}: {line.line_descr}")
-        if len(lines) > 20:
-            print(f"... and {len(lines) - 20} more")
+        from core.api import OasthAPI
+        # Read from disk while the cached catalogue is fresh (a week)
+        api = OasthAPI(metadata_cache=MetadataCache())
+        # Streamed: the first lines print while the rest are still arriving
+        count = 0
+        for line in api.iter_lines():
+            count += 1
+            if count <= 20:  # First 20
+                print(f"{line.line_id}: {line.line_descr}", flush=True)
+        if count > 20:
+            print(f"... and {count - 20} more")
+        return
+    
+    # Stop codes from stdin
+    if args.batch:
+        run_batch(args)
+        return
+    
+    if args.monitor:
+        run_monitor(args)
+        return
+    
+    # Boards from a config file
+    if args.config:
+        render_boards(args)
         return
     
     # Get arrivals
-    if not args.stop:
-        parser.error("--stop is required")
+    if not args.stop and not args.street:
+        parser.error("--stop or --street is required")
+    
+    stop_code = args.street or args.stop
+    stop_name = args.stop_name
+    fetch = None
+    if not args.no_daemon:
+        from core.daemon_client import fetch_arrivals, fetch_street_arrivals
+        if args.street:
+            fetch = lambda max_age: fetch_street_arrivals(
+                args.street, max_age=max_age, deadline=args.deadline)
+        else:
+            fetch = lambda max_age: fetch_arrivals(
+                args.stop, max_age=max_age, deadline=args.deadline)
+        arrivals = fetch(args.horizon)
+        if arrivals is None:
+            fetch = None  # No daemon running
+    renewer = None
+    if fetch is None:
+        from core.api import OasthAPI
+        cache = ArrivalCache(ttl=args.horizon) if args.horizon > 0 else None
+        api = OasthAPI(cache=cache)
+        if args.street:
+            fetch = lambda max_age: api.get_arrivals_for_street(args.street, max_age, args.deadline)
+        else:
+            fetch = lambda max_age: api.get_arrivals(args.stop, max_age, args.deadline)
+        if args.watch:
+            from core.session import SessionRenewer
+            renewer = SessionRenewer(on_renew=api.set_session)
+        else:
+            arrivals = fetch(args.horizon)
+    
+    if args.street and not stop_name:
+        from core.stops import StopIndex
+        with StopIndex() as index:
+            stop = index.get(args.street)
+        stop_name = stop.stop_descr if stop else ''
+    
+    if args.watch:
+        if renewer:
+            renewer.start()
+        try:
+            run_watch(args, fetch, stop_code, stop_name)
+        finally:
+            if renewer:
+                renewer.stop()
+        return
     
-    arrivals = get_arrivals(args.stop)
+    # Count cached estimates down to now
+    arrivals = project(arrivals)
     
     # Format output
     if args.format == 'json':
@@ -142,8 +594,9 @@ Examples:
     elif args.format == 'plain':
         print(format_plain(arrivals))
     else:
-        print(format_ansi(arrivals, args.stop, args.stop_name))
+        print(format_ansi(arrivals, stop_code, stop_name, args.max_times))
 
 
 if __name__ == "__main__":
     main()
+    release_stdout()
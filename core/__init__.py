@@ -2,19 +2,69 @@
 OASTH Core Library
 ==================
 Hybrid session management + pure HTTP API client.
+
+Submodules are imported on first attribute access, so short-lived
+callers only load what they actually use.
 """
 
-from .session import get_session, clear_session_cache, SessionData
-from .api import OasthAPI, get_arrivals
-from .models import BusArrival, BusLine, BusStop
-
-__all__ = [
-    'get_session',
-    'clear_session_cache', 
-    'SessionData',
-    'OasthAPI',
-    'get_arrivals',
-    'BusArrival',
-    'BusLine',
-    'BusStop',
-]
+import importlib
+
+_EXPORTS = {
+    'get_session': '.session',
+    'clear_session_cache': '.session',
+    'SessionData': '.session',
+    'SessionRenewer': '.session',
+    'OasthAPI': '.api',
+    'get_arrivals': '.api',
+    'AsyncOasthAPI': '.async_api',
+    'get_arrivals_many': '.async_api',
+    'BusArrival': '.models',
+    'ArrivalBatch': '.models',
+    'BusLine': '.models',
+    'BusLineInfo': '.models',
+    'BusStop': '.models',
+    'StreetStop': '.models',
+    'BusRoute': '.models',
+    'ArrivalCache': '.cache',
+    'CacheStats': '.cache',
+    'MetadataCache': '.cache',
+    'MetadataLookup': '.lookup',
+    'enrich_arrivals': '.lookup',
+    'Topology': '.topology',
+    'refresh_topology': '.topology',
+    'StopIndex': '.stops',
+    'search_stops': '.stops',
+    'StopGeoIndex': '.geo',
+    'load_geo_index': '.geo',
+    'Board': '.boards',
+    'load_boards': '.boards',
+    'fetch_boards': '.boards',
+    'stream_arrivals': '.batch',
+    'PollScheduler': '.scheduler',
+    'Resilience': '.resilience',
+    'RetryPolicy': '.resilience',
+    'CircuitOpenError': '.resilience',
+    'DeadlineExceeded': '.resilience',
+    'Coalescer': '.coalesce',
+    'Transport': '.transport',
+    'RequestsTransport': '.transport',
+    'HttpxTransport': '.transport',
+    'FakeTransport': '.transport',
+    'RecordingTransport': '.transport',
+    'poll_interval': '.watch',
+    'project': '.watch',
+}
+
+__all__ = list(_EXPORTS)
+
+
+def __getattr__(name):
+    if name not in _EXPORTS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(_EXPORTS[name], __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
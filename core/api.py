@@ -2,126 +2,608 @@
 OASTH API Client
 ================
 Pure HTTP API client using cached session credentials.
+
+HTTP goes through a core.transport backend (requests by default), which
+imports its library on first use, so answers served from the arrivals
+cache never pay for loading it.
 """
 
-import requests
-from typing import List, Optional
-from .session import get_session, SessionData
-from .models import BusArrival, BusLine, BusStop
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, Iterable, Iterator, List, Optional, Tuple
+from .session import get_session, record_expiry, SessionData
+from .models import ArrivalBatch, BusArrival, BusLine, BusLineInfo, BusRoute, BusStop
+from .cache import ArrivalCache, MetadataCache
+from .coalesce import Coalescer, request_key
+from .resilience import CircuitOpenError, DeadlineExceeded, Resilience, ResilienceStats
+from .transport import DEFAULT_POOL_SIZE, RequestsTransport, Transport, TransportError
 
 
 BASE_URL = "https://telematics.oasth.gr/api/"
+REQUEST_TIMEOUT = 10  # Seconds
 
 
 class OasthAPI:
-    """OASTH API client with automatic session management"""
+    """
+    OASTH API client with automatic session management.
     
-    def __init__(self, session_data: Optional[SessionData] = None):
+    One client can be shared by any number of threads. Session credentials
+    are swapped under a lock and carry a version number: a request that
+    gets a 401 only refreshes the session if it is still the one that
+    request used, so a late 401 on an old token never discards a newer one.
+    """
+    
+    def __init__(self, session_data: Optional[SessionData] = None,
+                 cache: Optional[ArrivalCache] = None,
+                 resilience: Optional[Resilience] = None,
+                 timeout: float = REQUEST_TIMEOUT,
+                 pool_size: int = DEFAULT_POOL_SIZE,
+                 base_url: str = BASE_URL,
+                 session_factory: Optional[Callable[..., SessionData]] = None,
+                 transport: Optional[Transport] = None,
+                 metadata_cache: Optional[MetadataCache] = None):
         """
         Initialize API client.
         
         Args:
             session_data: Optional pre-loaded session. If None, will load automatically.
+            cache: Optional arrivals cache shared with other processes.
+            resilience: Retry, rate limit and circuit breaker settings.
+                If None, the defaults from core.resilience are used.
+            timeout: Seconds to wait for each HTTP attempt
+            pool_size: Connections kept open per host; match it to the
+                number of threads sharing the client.
+            base_url: API endpoint, e.g. a local stand-in for testing
+            session_factory: Called like get_session(force_refresh=, stale=)
+                to obtain credentials. Defaults to get_session.
+            transport: HTTP backend (see core.transport). Defaults to a
+                RequestsTransport with pool_size connections.
+            metadata_cache: Optional cache for the line catalogue and route
+                lookups, which change a few times a year.
         """
         self._session_data = session_data
-        self._http = requests.Session()
+        self._session_version = 0
+        self._session_lock = threading.Lock()
+        self._session_factory = session_factory or get_session
+        self._headers = None  # Built once per session, see _get_headers()
+        self._pool_size = max(1, pool_size)
+        self._pool_lock = threading.Lock()
+        self._transport = transport or RequestsTransport(self._pool_size)
+        self._cache = cache
+        self._metadata_cache = metadata_cache
+        self._resilience = resilience or Resilience()
+        self._timeout = timeout
+        self._coalescer = Coalescer()
+        self.base_url = base_url
+    
+    @property
+    def transport(self) -> Transport:
+        """The HTTP backend"""
+        return self._transport
+    
+    @property
+    def pool_size(self) -> int:
+        """Connections kept open per host"""
+        return self._pool_size
+    
+    def set_pool_size(self, pool_size: int):
+        """Grow the connection pool, e.g. before sharing the client with more threads"""
+        with self._pool_lock:
+            if pool_size <= self._pool_size:
+                return
+            self._pool_size = pool_size
+            self._transport.set_pool_size(pool_size)
+    
+    def _current_session(self) -> Tuple[int, SessionData]:
+        """(version, credentials), loading or renewing them if needed"""
+        with self._session_lock:
+            if self._session_data is None or not self._session_data.is_valid():
+                # Held while loading, so concurrent callers wait for one bootstrap
+                self._swap_session(self._session_factory())
+            return self._session_version, self._session_data
     
     def _ensure_session(self) -> SessionData:
         """Ensure we have valid session credentials"""
-        if self._session_data is None or not self._session_data.is_valid():
-            self._session_data = get_session()
-        return self._session_data
-    
-    def _get_headers(self) -> dict:
-        """Get headers for API requests"""
-        session = self._ensure_session()
-        return {
+        return self._current_session()[1]
+    
+    def _expire_session(self, version: int) -> Tuple[int, SessionData]:
+        """
+        Handle a 401 for a request made with session `version`.
+        
+        Only the first thread to report a given version refreshes; the
+        others, and requests made with an older version, get the session
+        that replaced it.
+        """
+        with self._session_lock:
+            if version == self._session_version:
+                stale = self._session_data
+                if stale is not None:
+                    record_expiry(stale)
+                self._swap_session(self._session_factory(force_refresh=True, stale=stale))
+            return self._session_version, self._session_data
+    
+    def set_session(self, session_data: SessionData):
+        """
+        Replace the session credentials, e.g. from a SessionRenewer.
+        
+        Ignored if the client already holds a session created later.
+        """
+        with self._session_lock:
+            current = self._session_data
+            if current is not None and current.created_at > session_data.created_at:
+                return
+            if current is not session_data:
+                self._swap_session(session_data)
+    
+    def _swap_session(self, session_data: SessionData):
+        """Install new credentials. Caller holds _session_lock."""
+        self._session_data = session_data
+        self._session_version += 1
+        self._headers = None
+    
+    @property
+    def session_version(self) -> int:
+        """Bumped every time the credentials are replaced"""
+        with self._session_lock:
+            return self._session_version
+    
+    @property
+    def metrics(self) -> ResilienceStats:
+        """Retry, throttling, circuit breaker and coalescing counters"""
+        stats = self._resilience.stats
+        stats.coalesced = self._coalescer.shared
+        return stats
+    
+    def _get_headers(self, session: Optional[SessionData] = None) -> dict:
+        """
+        Get headers for API requests, session cookie included.
+        
+        Built once per session and reused; treat the result as read-only.
+        """
+        if session is None:
+            session = self._ensure_session()
+        cached = self._headers
+        if cached is not None and cached[0] is session:
+            return cached[1]
+        headers = {
             'User-Agent': 'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36',
             'Accept': 'application/json, text/javascript, */*; q=0.01',
             'X-Requested-With': 'XMLHttpRequest',
             'X-CSRF-Token': session.token,
             'Origin': 'https://telematics.oasth.gr',
             'Referer': 'https://telematics.oasth.gr/en/',
+            'Cookie': f'PHPSESSID={session.phpsessid}',
         }
-    
-    def _get_cookies(self) -> dict:
-        """Get cookies for API requests"""
-        session = self._ensure_session()
-        return {'PHPSESSID': session.phpsessid}
+        self._headers = (session, headers)
+        return headers
     
     def _request(self, act: str, params: dict = None, method: str = 'GET') -> dict:
-        """Make API request"""
-        url = f"{BASE_URL}?act={act}"
+        """
+        Make API request, with retries, rate limiting and circuit breaking.
+        
+        Concurrent identical requests share one upstream call.
+        """
+        return self._coalescer.call(request_key(act, params, method),
+                                    lambda: self._call(act, params, method))
+    
+    def _url(self, act: str, params: dict = None) -> str:
+        url = f"{self.base_url}?act={act}"
         
         if params:
             param_str = "&".join(f"{k}={v}" for k, v in params.items())
             url = f"{url}&{param_str}"
         
-        headers = self._get_headers()
-        cookies = self._get_cookies()
+        return url
+    
+    def _call(self, act: str, params: dict = None, method: str = 'GET') -> dict:
+        """Make one API request without coalescing"""
+        url = self._url(act, params)
+        return self._resilience.call(act, lambda: self._send(url, method).json())
+    
+    def _send(self, url: str, method: str, stream: bool = False):
+        """
+        Make one HTTP attempt, refreshing the session once on a 401.
         
-        if method == 'GET':
-            resp = self._http.get(url, headers=headers, cookies=cookies, timeout=10)
-        else:
-            resp = self._http.post(url, headers=headers, cookies=cookies, timeout=10)
+        Returns the transport's Response, or its StreamedResponse if
+        `stream` is set.
+        """
+        send = self._transport.stream if stream else self._transport.request
+        version, session = self._current_session()
+        resp = send(method, url, self._get_headers(session), self._timeout)
         
         if resp.status_code == 401:
-            # Session expired, refresh and retry
-            self._session_data = get_session(force_refresh=True)
-            headers = self._get_headers()
-            cookies = self._get_cookies()
-            
-            if method == 'GET':
-                resp = self._http.get(url, headers=headers, cookies=cookies, timeout=10)
-            else:
-                resp = self._http.post(url, headers=headers, cookies=cookies, timeout=10)
+            # Session expired: refresh it, or pick up the one that replaced it
+            if stream:
+                resp.close()
+            version, session = self._expire_session(version)
+            resp = send(method, url, self._get_headers(session), self._timeout)
         
         resp.raise_for_status()
-        return resp.json()
+        return resp
+    
+    def _stream(self, act: str, params: dict = None, method: str = 'GET') -> Iterator[Any]:
+        """
+        Make an API request and yield the elements of its JSON array body
+        as they arrive.
+        
+        Retries, rate limits and the circuit breaker cover getting the
+        response; a connection lost halfway through the body raises
+        TransportError from the iteration, since elements already yielded
+        cannot be taken back. Streams are not coalesced.
+        """
+        from .jsonstream import iter_json_array
+        
+        url = self._url(act, params)
+        with self._resilience.call(act, lambda: self._send(url, method, stream=True)) as resp:
+            yield from iter_json_array(resp)
+    
+    def _hedged_request(self, act: str, params: dict, deadline: float) -> dict:
+        """
+        Make an API request that must answer within `deadline` seconds.
+        
+        If the request is still running after the act's p95 latency, an
+        identical one is sent and whichever answers first wins; the other
+        is abandoned. Hedges are capped at a share of all requests.
+        
+        Only callers with the same deadline join a request already in
+        flight, so a DeadlineExceeded is never handed to a caller that did
+        not set that deadline (plain _request() calls included).
+        
+        Raises:
+            DeadlineExceeded: Neither request answered in time
+        """
+        from concurrent.futures import TimeoutError
+        
+        try:
+            return self._coalescer.call(request_key(act, params) + (('deadline', deadline),),
+                                        lambda: self._hedge(act, params, deadline),
+                                        timeout=deadline)
+        except TimeoutError:  # Ours, or the joined call's (DeadlineExceeded is one)
+            self._resilience.count('deadline_misses')
+            raise DeadlineExceeded(f"{act} did not answer within {deadline:g}s") from None
+    
+    def _hedge(self, act: str, params: dict, deadline: float) -> dict:
+        """Body of _hedged_request, run by the first caller only"""
+        from concurrent.futures import FIRST_COMPLETED, wait
+        
+        end = time.monotonic() + deadline
+        primary = _spawn(self._call, act, params)
+        pending = {primary}
+        hedge_at = time.monotonic() + self._resilience.hedge_delay(act)
+        hedged = False
+        error = None
+        
+        while pending:
+            now = time.monotonic()
+            if now >= end:
+                break
+            timeout = end - now if hedged else min(end, hedge_at) - now
+            done, pending = wait(pending, timeout=max(0, timeout), return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    if future is not primary:
+                        self._resilience.count('hedge_wins')
+                    return future.result()
+                error = future.exception()
+            
+            if not hedged and pending and time.monotonic() >= hedge_at:
+                hedged = True
+                if self._resilience.try_hedge():
+                    pending.add(_spawn(self._call, act, params))
+        
+        if not pending and error is not None:
+            raise error
+        raise DeadlineExceeded(f"{act} did not answer within {deadline:g}s")
+    
+    def _arrivals_response(self, stop_code: str, max_age: Optional[float],
+                           deadline: Optional[float]) -> Tuple[list, float, bool]:
+        """(raw records, fetched_at, stale) for a stop; see get_arrivals()"""
+        params = {'p1': stop_code}
+        # With a cache, the deadline also covers waiting on another caller's
+        # fetch of the same stop, and the request gets what is left of it
+        end = None
+        if deadline is not None and self._cache is not None:
+            end = time.monotonic() + deadline
+        
+        def fetch():
+            if deadline is None:
+                return self._request('getStopArrivals', params)
+            remaining = deadline if end is None else end - time.monotonic()
+            if remaining <= 0:
+                raise DeadlineExceeded(f"getStopArrivals did not answer within {deadline:g}s")
+            return self._hedged_request('getStopArrivals', params, remaining)
+        
+        stale = False
+        if self._cache is not None:
+            try:
+                fetched_at, data = self._cache.get_entry(stop_code, fetch, max_age, deadline)
+            except (CircuitOpenError, TimeoutError) as e:  # DeadlineExceeded is a TimeoutError
+                # Server is struggling or slow: an old board beats no board
+                entry = self._cache.read(stop_code)
+                if entry is None:
+                    if isinstance(e, (CircuitOpenError, DeadlineExceeded)):
+                        raise
+                    raise DeadlineExceeded(  # Timed out waiting for the other fetch
+                        f"getStopArrivals did not answer within {deadline:g}s") from None
+                fetched_at, data = entry
+                stale = True
+        else:
+            data = fetch()
+            fetched_at = time.time()
+        
+        return data if isinstance(data, list) else [], fetched_at, stale
     
-    def get_arrivals(self, stop_code: str) -> List[BusArrival]:
+    def get_arrivals(self, stop_code: str, max_age: Optional[float] = None,
+                     deadline: Optional[float] = None) -> List[BusArrival]:
         """
         Get bus arrivals for a stop.
         
         Args:
             stop_code: The stop code (e.g., "3344")
+            max_age: Oldest cached response to accept, in seconds; an older
+                one is re-fetched before returning (defaults to the cache's
+                ttl, with stale-while-revalidate)
+            deadline: Seconds to wait for the server, hedging slow requests.
+                When it runs out, the last cached response is returned
+                with `stale` set.
+            
+        Returns:
+            List of upcoming bus arrivals, stamped with their fetch time
+        """
+        return BusArrival.from_api_list(*self._arrivals_response(stop_code, max_age, deadline))
+    
+    def get_arrivals_batch(self, stop_code: str, max_age: Optional[float] = None,
+                           deadline: Optional[float] = None) -> ArrivalBatch:
+        """
+        Like get_arrivals(), but returns the compact column-wise form.
+        
+        Meant for snapshots of many stops that are kept in memory.
+        """
+        return ArrivalBatch.from_api(*self._arrivals_response(stop_code, max_age, deadline))
+    
+    def get_arrivals_for_street(self, street_id: str, max_age: Optional[float] = None,
+                                deadline: Optional[float] = None) -> List[BusArrival]:
+        """
+        Get bus arrivals for a physical stop that may have several stop codes.
+        
+        All stop codes listed for the Street ID in stops.json are queried
+        concurrently and merged into one board.
+        
+        Args:
+            street_id: The code on the stop sign (e.g., "1403")
+            max_age: Oldest cached response to accept, in seconds
+            deadline: Seconds to wait for the server (see get_arrivals)
             
         Returns:
-            List of upcoming bus arrivals
+            List of upcoming bus arrivals, soonest first
         """
-        data = self._request('getStopArrivals', {'p1': stop_code})
+        stop_codes = street_stop_codes(street_id)
+        if len(stop_codes) == 1:
+            return merge_arrivals([self.get_arrivals(stop_codes[0], max_age, deadline)])
         
-        if not isinstance(data, list):
-            return []
+        from concurrent.futures import ThreadPoolExecutor
         
-        return [BusArrival.from_api(item) for item in data]
+        self._ensure_session()
+        with ThreadPoolExecutor(max_workers=len(stop_codes)) as pool:
+            return merge_arrivals(pool.map(
+                lambda code: self.get_arrivals(code, max_age, deadline), stop_codes))
     
-    def get_lines(self) -> List[BusLine]:
-        """Get all bus lines"""
-        data = self._request('webGetLines', method='POST')
+    def _metadata(self, act: str, params: dict = None, strict: bool = False) -> list:
+        """
+        Make a catalogue request, served from the metadata cache if there is one.
+        
+        Answers that are not lists (errors) are never cached. If the server
+        cannot be reached, a cached answer of any age is returned. Without
+        one, a non-list answer gives [], or raises _NotACatalogue if
+        `strict` is set.
+        """
+        def fetch():
+            data = self._request(act, params, method='POST')
+            if not isinstance(data, list):
+                raise _NotACatalogue(f"{act} answered with {type(data).__name__}, not a list")
+            return data
         
-        if not isinstance(data, list):
-            return []
+        cache = self._metadata_cache
+        if cache is None:
+            try:
+                return fetch()
+            except _NotACatalogue:
+                if strict:
+                    raise
+                return []
         
-        return [BusLine.from_api(item) for item in data]
+        key = _metadata_key(act, params)
+        try:
+            return cache.get(key, fetch)
+        except (CircuitOpenError, TransportError, _NotACatalogue) as e:
+            entry = cache.read(key)
+            if entry is not None:
+                return entry[1]
+            if isinstance(e, _NotACatalogue) and not strict:
+                return []
+            raise
+    
+    def _iter_metadata(self, act: str) -> Iterator[Any]:
+        """
+        Streamed counterpart of _metadata(): yield the elements of a
+        catalogue response, from the metadata cache while it is fresh.
+        
+        A fetched stream is written to the cache as it is consumed, and
+        stored only if it is read to the end.
+        """
+        cache = self._metadata_cache
+        if cache is None:
+            yield from self._stream(act, method='POST')
+            return
+        
+        key = _metadata_key(act)
+        age = cache.age(key)
+        if age is not None and age <= cache.ttl:
+            yield from cache.iter(key)
+            return
+        
+        yielded = 0
+        try:
+            with cache.writer(key) as writer:
+                for item in self._stream(act, method='POST'):
+                    writer.add(item)
+                    yielded += 1
+                    yield item
+                if yielded:
+                    writer.commit()
+        except (CircuitOpenError, TransportError):
+            if yielded or age is None:
+                raise
+            yield from cache.iter(key)  # Old catalogue beats none
+    
+    def get_catalogue(self, act: str, params: dict = None,
+                      strict: bool = False) -> List[dict]:
+        """
+        Raw records of a catalogue request, through the metadata cache.
+        
+        Args:
+            act: webGetLines, webGetLinesWithMLInfo, webGetRoutesForLine
+                or webGetStopsForRoute
+            params: e.g. {'p1': line_code}
+            strict: Raise instead of returning [] when the server answers
+                with something other than a list (null, an error object),
+                so a failed request is not taken for an empty catalogue
+            
+        Returns:
+            The records as the server sent them
+            
+        Raises:
+            ValueError: `strict` is set and the answer was not a list
+        """
+        return [item for item in self._metadata(act, params, strict) if isinstance(item, dict)]
+    
+    def get_lines(self) -> List[BusLine]:
+        """Get all bus lines"""
+        return [BusLine.from_api(item) for item in self._metadata('webGetLines')]
     
     def get_lines_detailed(self) -> List[dict]:
         """Get all bus lines with ML info"""
-        return self._request('webGetLinesWithMLInfo', method='POST')
+        return self._metadata('webGetLinesWithMLInfo')
+    
+    def iter_lines(self) -> Iterator[BusLine]:
+        """
+        Get all bus lines, parsed while the response is still arriving.
+        
+        Unlike get_lines(), the whole body is never held in memory, and the
+        first lines are available before the last ones have been received.
+        """
+        for item in self._iter_metadata('webGetLines'):
+            if isinstance(item, dict):
+                yield BusLine.from_api(item)
+    
+    def iter_lines_detailed(self) -> Iterator[BusLineInfo]:
+        """Get all bus lines with ML info, parsed while the response is still arriving"""
+        for item in self._iter_metadata('webGetLinesWithMLInfo'):
+            if isinstance(item, dict):
+                yield BusLineInfo.from_api(item)
+    
+    def get_routes_for_line(self, line_code: str) -> List[BusRoute]:
+        """
+        Get the routes (directions/variants) of a line.
+        
+        Args:
+            line_code: Internal line code (BusLine.line_code)
+            
+        Returns:
+            List of routes
+        """
+        data = self._metadata('webGetRoutesForLine', {'p1': line_code})
+        return [BusRoute.from_api(item) for item in data]
+    
+    def get_stops_for_route(self, route_code: str) -> List[BusStop]:
+        """
+        Get the stops served by a route, in order, with coordinates.
+        
+        Args:
+            route_code: Internal route code (BusRoute.route_code)
+            
+        Returns:
+            List of stops
+        """
+        data = self._metadata('webGetStopsForRoute', {'p1': route_code})
+        return [BusStop.from_api(item) for item in data]
+
+
+class _NotACatalogue(ValueError):
+    """A catalogue request answered with something other than a list"""
+
+
+def _metadata_key(act: str, params: dict = None) -> str:
+    """Metadata cache key, e.g. 'webGetRoutesForLine-62'"""
+    return '-'.join([act, *(str(v) for v in (params or {}).values())])
+
+
+def _spawn(fn, *args) -> Future:
+    """Run fn on a daemon thread, so an abandoned request never holds up exit"""
+    future = Future()
+    
+    def run():
+        if not future.set_running_or_notify_cancel():
+            return
+        try:
+            future.set_result(fn(*args))
+        except BaseException as e:
+            future.set_exception(e)
+    
+    threading.Thread(target=run, name='oasth-request', daemon=True).start()
+    return future
+
+
+def street_stop_codes(street_id: str) -> List[str]:
+    """
+    Resolve a Street ID to the stop codes getStopArrivals accepts.
+    
+    Unknown IDs are assumed to already be stop codes, like the Android app does.
+    """
+    from .stops import StopIndex
+    
+    with StopIndex() as index:
+        stop = index.get(street_id)
+    if stop is None or not stop.api_ids:
+        return [street_id]
+    return stop.api_ids
+
+
+def merge_arrivals(boards: Iterable[List[BusArrival]]) -> List[BusArrival]:
+    """
+    Merge arrivals from several stop codes into one board.
+    
+    The same bus can be reported by more than one code; it is kept once,
+    with its soonest estimate. Estimates fetched at different times are
+    compared as projected to now.
+    """
+    now = time.time()
+    merged = {}
+    for arrivals in boards:
+        for a in arrivals:
+            a = a.projected(now)
+            key = (a.vehicle_code, a.route_code)
+            if not a.vehicle_code:
+                key = (id(a), a.route_code)  # No way to tell buses apart
+            if key not in merged or a.estimated_minutes < merged[key].estimated_minutes:
+                merged[key] = a
+    return sorted(merged.values(), key=lambda a: a.estimated_minutes)
 
 
 # Convenience function
-def get_arrivals(stop_code: str) -> List[BusArrival]:
+def get_arrivals(stop_code: str, cache: Optional[ArrivalCache] = None) -> List[BusArrival]:
     """
     Quick function to get arrivals for a stop.
     
     Args:
         stop_code: The stop code
+        cache: Optional arrivals cache
         
     Returns:
         List of bus arrivals
     """
-    api = OasthAPI()
+    api = OasthAPI(cache=cache)
     return api.get_arrivals(stop_code)
 
 
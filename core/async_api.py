@@ -0,0 +1,181 @@
+"""
+OASTH Async API Client
+======================
+asyncio front-end over OasthAPI for fetching many stops at once.
+
+Requests run on worker threads against a shared OasthAPI, so the session
+credentials, connection pool and 401 refresh-and-retry logic are exactly
+the ones used by the blocking client. The client owns its thread pool,
+sized to its concurrency: the loop's default executor has min(32, CPUs + 4)
+workers and would quietly cap how many requests are in flight.
+"""
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, List, Optional, TypeVar, Union
+
+from .api import OasthAPI, merge_arrivals, street_stop_codes
+from .coalesce import Coalescer
+from .models import BusArrival, BusLine
+from .session import SessionData
+
+
+DEFAULT_CONCURRENCY = 8
+
+T = TypeVar('T')
+
+
+class AsyncOasthAPI:
+    """asyncio OASTH API client with bounded concurrency"""
+
+    def __init__(self, session_data: Optional[SessionData] = None,
+                 concurrency: int = DEFAULT_CONCURRENCY,
+                 api: Optional[OasthAPI] = None):
+        """
+        Initialize async API client.
+
+        Args:
+            session_data: Optional pre-loaded session. If None, will load automatically.
+            concurrency: Default maximum number of requests in flight.
+            api: Optional blocking client to share. If None, a new one is created.
+        """
+        self._concurrency = max(1, concurrency)
+        self._api = api or OasthAPI(session_data, pool_size=self._concurrency)
+        self._coalescer = Coalescer()
+        self._workers = 0
+        self._executor = None
+        self._reserve(self._concurrency)
+
+    def _reserve(self, workers: int):
+        """Make sure `workers` requests can run at once"""
+        if workers <= self._workers:
+            return
+        old, self._executor = self._executor, ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix='oasth-async')
+        self._workers = workers
+        if old is not None:
+            old.shutdown(wait=False)  # Running requests finish on their own
+
+        # Keep one pooled connection per worker so parallel requests
+        # reuse TLS connections instead of opening and dropping extras.
+        self._api.set_pool_size(workers)
+
+    async def _run(self, fn: Callable[..., T], *args) -> T:
+        """Run a blocking call on the client's thread pool"""
+        return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+
+    def close(self):
+        """Shut down the worker threads"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+
+    @property
+    def api(self) -> OasthAPI:
+        """The underlying blocking client"""
+        return self._api
+
+    async def get_arrivals(self, stop_code: str, max_age: Optional[float] = None,
+                           deadline: Optional[float] = None) -> List[BusArrival]:
+        """
+        Get bus arrivals for a stop.
+
+        Args:
+            stop_code: The stop code (e.g., "3344")
+            max_age: Oldest cached response to accept (see OasthAPI.get_arrivals)
+            deadline: Seconds to wait for the server (see OasthAPI.get_arrivals)
+
+        Returns:
+            List of upcoming bus arrivals
+        """
+        # Tasks asking for the same stop share one worker thread and request
+        return await self._coalescer.acall(
+            ('getStopArrivals', stop_code, max_age, deadline),
+            lambda: self._api.get_arrivals(stop_code, max_age, deadline),
+            self._executor)
+
+    async def get_arrivals_for_street(self, street_id: str, max_age: Optional[float] = None,
+                                      deadline: Optional[float] = None) -> List[BusArrival]:
+        """
+        Get merged arrivals for every stop code of a Street ID.
+
+        Args:
+            street_id: The code on the stop sign (e.g., "1403")
+            max_age: Oldest cached response to accept (see OasthAPI.get_arrivals)
+            deadline: Seconds to wait for the server, per stop code
+
+        Returns:
+            List of upcoming bus arrivals, soonest first
+        """
+        stop_codes = await self._run(street_stop_codes, street_id)
+        boards = await self.get_arrivals_many(stop_codes, max_age=max_age, deadline=deadline)
+        return merge_arrivals(boards.values())
+
+    async def get_lines(self) -> List[BusLine]:
+        """Get all bus lines"""
+        return await self._run(self._api.get_lines)
+
+    async def get_lines_detailed(self) -> List[dict]:
+        """Get all bus lines with ML info"""
+        return await self._run(self._api.get_lines_detailed)
+
+    async def get_arrivals_many(
+        self,
+        stop_codes: Iterable[str],
+        concurrency: Optional[int] = None,
+        return_exceptions: bool = False,
+        max_age: Optional[float] = None,
+        deadline: Optional[float] = None,
+    ) -> Dict[str, Union[List[BusArrival], BaseException]]:
+        """
+        Get bus arrivals for several stops concurrently.
+
+        Args:
+            stop_codes: Stop codes to query. Duplicates are fetched once.
+            concurrency: Maximum requests in flight (defaults to the client's).
+            return_exceptions: If True, a failing stop maps to its exception
+                instead of aborting the whole batch.
+            max_age: Oldest cached response to accept (see OasthAPI.get_arrivals)
+            deadline: Seconds to wait for the server, per stop
+
+        Returns:
+            Dict of stop code to arrivals, in the order the codes were given
+        """
+        codes = list(dict.fromkeys(stop_codes))
+        limit = max(1, concurrency or self._concurrency)
+        self._reserve(min(limit, max(1, len(codes))))
+
+        # Make sure credentials exist before fanning out, so the workers
+        # don't all race to bootstrap the same session.
+        if codes:
+            await self._run(self._api._ensure_session)
+
+        semaphore = asyncio.Semaphore(limit)
+
+        async def fetch(code: str) -> List[BusArrival]:
+            async with semaphore:
+                return await self.get_arrivals(code, max_age, deadline)
+
+        results = await asyncio.gather(
+            *(fetch(code) for code in codes),
+            return_exceptions=return_exceptions,
+        )
+        return dict(zip(codes, results))
+
+
+def get_arrivals_many(stop_codes: Iterable[str],
+                      concurrency: int = DEFAULT_CONCURRENCY) -> Dict[str, List[BusArrival]]:
+    """
+    Quick function to get arrivals for several stops from blocking code.
+
+    Args:
+        stop_codes: The stop codes
+        concurrency: Maximum requests in flight
+
+    Returns:
+        Dict of stop code to bus arrivals
+    """
+    api = AsyncOasthAPI(concurrency=concurrency)
+    try:
+        return asyncio.run(api.get_arrivals_many(stop_codes))
+    finally:
+        api.close()
@@ -0,0 +1,70 @@
+"""
+OASTH Batch Fetching
+====================
+Stream arrivals for an unbounded sequence of stop codes.
+
+Stop codes are pulled from the input only as worker slots free up, and
+results are yielded as soon as each one completes, so memory stays
+constant however long the input is.
+"""
+
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from itertools import islice
+from typing import Iterable, Iterator, List, Optional
+
+from .models import BusArrival
+
+
+DEFAULT_CONCURRENCY = 8
+
+
+@dataclass
+class BatchResult:
+    """Outcome of fetching one stop"""
+    stop_code: str
+    fetched_at: float                       # Unix timestamp of completion
+    arrivals: Optional[List[BusArrival]]    # None if the fetch failed
+    error: Optional[BaseException] = None
+
+
+def stream_arrivals(stop_codes: Iterable[str], api=None,
+                    concurrency: int = DEFAULT_CONCURRENCY) -> Iterator[BatchResult]:
+    """
+    Fetch arrivals for many stops, yielding results in completion order.
+
+    At most `concurrency` requests are in flight and at most that many
+    stop codes have been read ahead. A failing stop yields a result with
+    `error` set and does not stop the stream.
+
+    Args:
+        stop_codes: Stop codes, consumed lazily
+        api: Optional OasthAPI to use. If None, a new one is created.
+        concurrency: Maximum requests in flight
+
+    Yields:
+        One BatchResult per input stop code
+    """
+    if api is None:
+        from .api import OasthAPI
+        api = OasthAPI()
+
+    codes = iter(stop_codes)
+    concurrency = max(1, concurrency)
+
+    def fetch(code: str) -> BatchResult:
+        try:
+            arrivals = api.get_arrivals(code)
+        except Exception as e:
+            return BatchResult(code, time.time(), None, e)
+        return BatchResult(code, time.time(), arrivals)
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        pending = {pool.submit(fetch, code) for code in islice(codes, concurrency)}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield future.result()
+            for code in islice(codes, len(done)):
+                pending.add(pool.submit(fetch, code))
@@ -0,0 +1,121 @@
+"""
+OASTH Boards
+============
+Named departure boards defined in a TOML file, fetched together.
+
+    [boards.home]
+    name = "Home"              # Display name (defaults to the table key)
+    stops = ["3344", "1029"]   # Stop codes shown on this board
+    lines = ["01", "31"]       # Optional line filter
+    max_times = 2              # Optional times shown per line
+
+Every distinct stop code across all boards is fetched once, concurrently,
+over one connection pool; boards are then assembled from those results.
+"""
+
+import asyncio
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Optional, Set, Tuple
+
+from .models import BusArrival
+
+
+DEFAULT_MAX_TIMES = 2
+
+
+@dataclass
+class Board:
+    """A named set of stops with its own line filter"""
+    key: str                       # Table name in the config file
+    name: str                      # Display name
+    stops: List[str]               # Stop codes
+    lines: Optional[Set[str]]      # Allowed line IDs, None for all
+    max_times: int                 # Times shown per line
+
+    @classmethod
+    def from_config(cls, key: str, data: dict) -> 'Board':
+        """Create from a [boards.<key>] table"""
+        stops = data.get('stops', [])
+        if isinstance(stops, (str, int)):
+            stops = [stops]
+        if not stops:
+            raise ValueError(f"Board '{key}' has no stops")
+        lines = data.get('lines')
+        return cls(
+            key=key,
+            name=data.get('name', key),
+            stops=[str(s) for s in stops],
+            lines={normalize_line(l) for l in lines} if lines else None,
+            max_times=int(data.get('max_times', DEFAULT_MAX_TIMES))
+        )
+
+    def select(self, arrivals: List[BusArrival]) -> List[BusArrival]:
+        """Keep only the arrivals of the board's lines"""
+        if self.lines is None:
+            return arrivals
+        return [a for a in arrivals if normalize_line(a.line_id) in self.lines]
+
+
+def normalize_line(line_id) -> str:
+    """Canonical form for comparing line IDs (" 1N" and "1n" are the same line)"""
+    return str(line_id).strip().upper()
+
+
+def load_boards(path: Path) -> List[Board]:
+    """
+    Read board definitions from a TOML file.
+
+    Args:
+        path: The config file
+
+    Returns:
+        Boards in file order
+    """
+    try:
+        import tomllib
+    except ImportError:  # Python < 3.11
+        import tomli as tomllib
+
+    with open(path, 'rb') as f:
+        config = tomllib.load(f)
+
+    boards = config.get('boards', {})
+    if not boards:
+        raise ValueError(f"No [boards.*] tables in {path}")
+    return [Board.from_config(key, data) for key, data in boards.items()]
+
+
+def fetch_boards(boards: List[Board], api=None, concurrency: Optional[int] = None
+                 ) -> Tuple[Dict[str, List[BusArrival]], Dict[str, BaseException]]:
+    """
+    Fetch arrivals for every board with one concurrent pass.
+
+    Stop codes shared by several boards are requested once. A stop that
+    fails is left out of its boards and reported instead of failing them all.
+
+    Args:
+        boards: Boards to fetch
+        api: Optional OasthAPI to use (its cache and session are shared)
+        concurrency: Maximum requests in flight
+
+    Returns:
+        (board key -> filtered arrivals soonest first, stop code -> error)
+    """
+    from .api import merge_arrivals
+    from .async_api import AsyncOasthAPI, DEFAULT_CONCURRENCY
+
+    stops = [code for board in boards for code in board.stops]
+    client = AsyncOasthAPI(api=api, concurrency=concurrency or DEFAULT_CONCURRENCY)
+    try:
+        results = asyncio.run(client.get_arrivals_many(stops, return_exceptions=True))
+    finally:
+        client.close()
+
+    errors = {code: r for code, r in results.items() if isinstance(r, BaseException)}
+    fetched = {code: r for code, r in results.items() if code not in errors}
+    arrivals = {
+        board.key: board.select(merge_arrivals(fetched.get(code, []) for code in board.stops))
+        for board in boards
+    }
+    return arrivals, errors
@@ -0,0 +1,411 @@
+"""
+OASTH Response Caches
+=====================
+On-disk caches of raw API responses, shared by every process of the same
+user.
+
+- ArrivalCache: getStopArrivals, seconds-long TTL
+- MetadataCache: line catalogue and route lookups, week-long TTL, with a
+  content hash so a refresh that finds nothing new does not rewrite
+
+Entries are JSON files written atomically (temp file + rename), so readers
+never see a half-written entry. A per-key lock file makes sure only one
+process fetches a given key at a time; the others wait and reuse its
+result. Within the stale window the cached value is returned immediately
+and refreshed on a background thread.
+"""
+
+import fcntl
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Any, Callable, Iterator, Optional, Tuple
+
+from .paths import CACHE_DIR, ensure_dir
+
+
+ARRIVALS_DIR = CACHE_DIR / 'arrivals'
+DEFAULT_TTL = 30        # Seconds an entry is served as fresh
+DEFAULT_STALE_TTL = 30  # Extra seconds it is served while being refreshed
+
+LOCK_POLL_INTERVAL = 0.02  # Seconds between tries of a key lock with a timeout
+
+METADATA_DIR = CACHE_DIR / 'metadata'
+METADATA_TTL = 7 * 24 * 3600         # The catalogue changes a few times a year
+METADATA_STALE_TTL = 30 * 24 * 3600
+METADATA_FORMAT = 1                  # Bump when the entry layout changes
+_HEADER_SIZE = 160                   # Bytes, newline included
+
+
+@dataclass
+class CacheStats:
+    """Counters for tuning the cache"""
+    hits: int = 0          # Fresh entry served
+    misses: int = 0        # Caller waited for a fetch
+    stale: int = 0         # Stale entry served, refresh started
+    refreshes: int = 0     # Background refreshes completed
+    errors: int = 0        # Background refreshes that failed
+    unchanged: int = 0     # Writes skipped because the content was the same
+
+
+class ArrivalCache:
+    """Disk-backed TTL cache with stale-while-revalidate"""
+
+    def __init__(self, path: Path = ARRIVALS_DIR, ttl: float = DEFAULT_TTL,
+                 stale_ttl: float = DEFAULT_STALE_TTL):
+        """
+        Initialize cache.
+
+        Args:
+            path: Directory holding the cache entries
+            ttl: Seconds an entry is considered fresh
+            stale_ttl: Seconds after ttl during which a stale entry is still
+                served while it is refreshed in the background
+        """
+        self.path = Path(path)
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self._stats = CacheStats()
+        self._lock = threading.Lock()
+        self._refreshing = set()
+
+    @property
+    def stats(self) -> CacheStats:
+        """Snapshot of the hit/miss/stale counters"""
+        with self._lock:
+            return CacheStats(**asdict(self._stats))
+
+    def _count(self, field: str):
+        with self._lock:
+            setattr(self._stats, field, getattr(self._stats, field) + 1)
+
+    def _file(self, key: str) -> Path:
+        safe = ''.join(c if c.isalnum() or c in '.-' else '_' for c in key)
+        return self.path / (safe + '.json')
+
+    @contextmanager
+    def _key_lock(self, key: str, blocking: bool = True, timeout: Optional[float] = None):
+        """
+        Inter-process lock for one key. Yields False if not acquired.
+
+        A blocking lock waits at most `timeout` seconds if one is given.
+        """
+        ensure_dir(self.path)
+        with open(self._file(key).with_suffix('.lock'), 'a') as f:
+            if blocking and timeout is None:
+                fcntl.flock(f, fcntl.LOCK_EX)
+            else:
+                # flock has no timeout: poll it until the time is up
+                end = time.monotonic() + (timeout if blocking else 0)
+                while True:
+                    try:
+                        fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                        break
+                    except BlockingIOError:
+                        remaining = end - time.monotonic()
+                        if remaining <= 0:
+                            yield False
+                            return
+                        time.sleep(min(LOCK_POLL_INTERVAL, remaining))
+            try:
+                yield True
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def read(self, key: str) -> Optional[Tuple[float, Any]]:
+        """Return (fetched_at, value) for a key, or None if absent"""
+        try:
+            with open(self._file(key), encoding='utf-8') as f:
+                entry = json.load(f)
+            return entry['fetched_at'], entry['data']
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def write(self, key: str, value: Any, fetched_at: Optional[float] = None):
+        """Store a value atomically"""
+        import tempfile  # Only needed on the write path
+
+        ensure_dir(self.path)
+        entry = {'fetched_at': fetched_at or time.time(), 'data': value}
+        fd, tmp = tempfile.mkstemp(dir=self.path, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(entry, f, ensure_ascii=False)
+            os.replace(tmp, self._file(key))
+        except BaseException:
+            os.unlink(tmp)
+            raise
+
+    def get(self, key: str, fetch: Callable[[], Any],
+            max_age: Optional[float] = None, timeout: Optional[float] = None) -> Any:
+        """
+        Get a value, fetching it if it is missing or expired.
+
+        Args:
+            key: Cache key (e.g., the stop code)
+            fetch: Called with no arguments to produce a fresh value
+            max_age: See get_entry()
+            timeout: See get_entry()
+
+        Returns:
+            The cached or freshly fetched value
+        """
+        return self.get_entry(key, fetch, max_age, timeout)[1]
+
+    def get_entry(self, key: str, fetch: Callable[[], Any],
+                  max_age: Optional[float] = None,
+                  timeout: Optional[float] = None) -> Tuple[float, Any]:
+        """
+        Like get(), but also return when the value was fetched.
+
+        Args:
+            key: Cache key (e.g., the stop code)
+            fetch: Called with no arguments to produce a fresh value
+            max_age: Oldest entry the caller accepts, in seconds. Overrides
+                the cache's ttl, and an older entry is always re-fetched
+                before returning instead of being served stale: callers
+                that pass it (a --horizon, a watch poll, the scheduler's
+                forced poll with 0) need data no older than that. Only
+                callers that leave it None get stale-while-revalidate.
+
+            timeout: Most seconds to wait while another thread or process
+                is fetching the same key (no limit if None). fetch itself
+                is not interrupted; it should bound its own time.
+
+        Returns:
+            (fetched_at, value)
+
+        Raises:
+            TimeoutError: timeout ran out waiting for the other fetch
+        """
+        ttl = self.ttl if max_age is None else max_age
+        entry = self.read(key)
+        if entry is not None:
+            age = time.time() - entry[0]
+            if age <= ttl:
+                self._count('hits')
+                return entry
+            if max_age is None and age <= ttl + self.stale_ttl:
+                self._count('stale')
+                self._revalidate(key, fetch)
+                return entry
+
+        with self._key_lock(key, timeout=timeout) as acquired:
+            if not acquired:
+                raise TimeoutError(f"{key} is being fetched by another caller")
+            # Another process may have fetched it while we waited
+            entry = self.read(key)
+            if entry is not None and time.time() - entry[0] <= ttl:
+                self._count('hits')
+                return entry
+
+            self._count('misses')
+            value = fetch()
+            fetched_at = time.time()
+            self.write(key, value, fetched_at)
+            return fetched_at, value
+
+    def _revalidate(self, key: str, fetch: Callable[[], Any]):
+        """Refresh a key on a background thread, once across processes"""
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+
+        def run():
+            try:
+                with self._key_lock(key, blocking=False) as acquired:
+                    if not acquired:
+                        return  # Another process is already on it
+                    self.write(key, fetch())
+                    self._count('refreshes')
+            except Exception:
+                self._count('errors')
+            finally:
+                with self._lock:
+                    self._refreshing.discard(key)
+
+        # Not a daemon thread: a short-lived CLI run finishes the refresh
+        # after printing, so the next run finds a fresh entry.
+        threading.Thread(target=run, name=f'oasth-refresh-{key}').start()
+
+    def clear(self):
+        """Remove every cached entry"""
+        if not self.path.exists():
+            return
+        for f in self.path.glob('*.json'):
+            f.unlink(missing_ok=True)
+
+
+class MetadataCache(ArrivalCache):
+    """
+    Long-lived cache of catalogue responses (lines, routes, route stops).
+
+    Each entry is a fixed-size header line followed by the JSON value. The
+    header holds the format version, a SHA-256 of the value and when the
+    value last changed; the file's mtime records when it was last
+    confirmed. A refresh that returns the same content only moves the
+    mtime. Entries of another format version read as missing.
+    """
+
+    def __init__(self, path: Path = METADATA_DIR, ttl: float = METADATA_TTL,
+                 stale_ttl: float = METADATA_STALE_TTL):
+        super().__init__(path, ttl, stale_ttl)
+
+    def header(self, key: str) -> Optional[dict]:
+        """Header of an entry ({'version', 'hash', 'changed_at'}), or None"""
+        try:
+            with open(self._file(key), 'rb') as f:
+                header = json.loads(f.readline())
+        except (OSError, ValueError):
+            return None
+        if not isinstance(header, dict) or header.get('version') != METADATA_FORMAT:
+            return None
+        return header
+
+    def digest(self, key: str) -> Optional[str]:
+        """Content hash of an entry, or None if absent"""
+        header = self.header(key)
+        return header and header.get('hash')
+
+    def age(self, key: str) -> Optional[float]:
+        """Seconds since an entry was last confirmed, or None if absent"""
+        if self.header(key) is None:
+            return None
+        try:
+            return time.time() - self._file(key).stat().st_mtime
+        except OSError:
+            return None
+
+    def read(self, key: str) -> Optional[Tuple[float, Any]]:
+        """Return (confirmed_at, value) for a key, or None if absent"""
+        try:
+            with open(self._file(key), 'rb') as f:
+                header = json.loads(f.readline())
+                if header.get('version') != METADATA_FORMAT:
+                    return None
+                value = json.loads(f.read())
+                return os.fstat(f.fileno()).st_mtime, value
+        except (OSError, ValueError, AttributeError):
+            return None
+
+    def iter(self, key: str) -> Iterator[Any]:
+        """Yield the elements of a cached JSON array without loading it whole"""
+        from .jsonstream import iter_json_array
+        from .transport import CHUNK_SIZE
+
+        try:
+            f = open(self._file(key), 'rb')
+        except OSError:
+            return
+        with f:
+            header = json.loads(f.readline())
+            if header.get('version') != METADATA_FORMAT:
+                return
+            yield from iter_json_array(iter(lambda: f.read(CHUNK_SIZE), b''))
+
+    def write(self, key: str, value: Any, fetched_at: Optional[float] = None):
+        """Store a value, unless the entry already holds the same content"""
+        with self.writer(key, fetched_at) as w:
+            w.write_value(value)
+            w.commit()
+
+    def writer(self, key: str, fetched_at: Optional[float] = None) -> 'MetadataWriter':
+        """Writer that stores a JSON array element by element"""
+        return MetadataWriter(self, key, fetched_at)
+
+
+class MetadataWriter:
+    """
+    Streams a value into a MetadataCache entry while hashing it.
+
+    Elements go to a temp file as they are added, so memory stays flat.
+    Nothing is stored unless commit() is called; a writer closed without
+    it (the stream broke off, the consumer stopped early) is discarded.
+    """
+
+    def __init__(self, cache: MetadataCache, key: str, fetched_at: Optional[float] = None):
+        import hashlib
+        import tempfile
+
+        self._cache = cache
+        self._key = key
+        self._fetched_at = fetched_at
+        self._hash = hashlib.sha256()
+        self._count = 0
+        ensure_dir(cache.path)
+        fd, self._tmp = tempfile.mkstemp(dir=cache.path, suffix='.tmp')
+        self._f = os.fdopen(fd, 'wb')
+        self._f.write(b' ' * _HEADER_SIZE)  # Filled in by commit()
+
+    def _put(self, data: bytes):
+        self._hash.update(data)
+        self._f.write(data)
+
+    def add(self, item: Any):
+        """Append one element of the array"""
+        self._put(b'[' if self._count == 0 else b',')
+        self._put(json.dumps(item, ensure_ascii=False, sort_keys=True,
+                             separators=(',', ':')).encode('utf-8'))
+        self._count += 1
+
+    def write_value(self, value: Any):
+        """Store a whole value (hashes the same as adding its elements one by one)"""
+        if isinstance(value, list):
+            for item in value:
+                self.add(item)
+            return
+        self._put(json.dumps(value, ensure_ascii=False, sort_keys=True,
+                             separators=(',', ':')).encode('utf-8'))
+        self._count = -1  # Written whole
+
+    def commit(self) -> bool:
+        """
+        Store the entry.
+
+        Returns:
+            False if the cache already held the same content, in which case
+            only its confirmation time moved
+        """
+        if self._count > 0:
+            self._put(b']')
+        elif self._count == 0:
+            self._put(b'[]')
+        digest = self._hash.hexdigest()
+        now = self._fetched_at or time.time()
+        target = self._cache._file(self._key)
+
+        if self._cache.digest(self._key) == digest:
+            self.discard()
+            try:
+                os.utime(target, (now, now))
+            except OSError:
+                pass
+            self._cache._count('unchanged')
+            return False
+
+        header = json.dumps({'version': METADATA_FORMAT, 'hash': digest, 'changed_at': now})
+        self._f.seek(0)
+        self._f.write(header.encode().ljust(_HEADER_SIZE - 1) + b'\n')
+        self._f.close()
+        os.utime(self._tmp, (now, now))
+        os.replace(self._tmp, target)
+        self._tmp = None
+        return True
+
+    def discard(self):
+        """Drop what was written"""
+        if self._tmp is not None:
+            self._f.close()
+            os.unlink(self._tmp)
+            self._tmp = None
+
+    def __enter__(self) -> 'MetadataWriter':
+        return self
+
+    def __exit__(self, *exc):
+        self.discard()
@@ -0,0 +1,122 @@
+"""
+OASTH Request Coalescing
+========================
+Concurrent identical requests share one upstream call.
+
+The first caller for a key runs the call; callers arriving while it is in
+flight wait on the same future and get the same result, or the same
+exception. Once the call finishes the key is forgotten, so the next caller
+starts a fresh request. Threads and asyncio tasks share one in-flight map.
+"""
+
+import threading
+from concurrent.futures import Executor, Future
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple, TypeVar
+
+T = TypeVar('T')
+
+
+def request_key(act: str, params: Optional[dict] = None, method: str = 'GET') -> Tuple:
+    """Key identifying an API request, independent of parameter order"""
+    return act, method, tuple(sorted((params or {}).items()))
+
+
+class Coalescer:
+    """In-flight map of running calls"""
+
+    def __init__(self):
+        self._in_flight: Dict[Hashable, Future] = {}
+        self._lock = threading.Lock()
+        self._calls = 0
+        self._shared = 0
+
+    @property
+    def shared(self) -> int:
+        """Calls answered by joining another caller's request"""
+        with self._lock:
+            return self._shared
+
+    @property
+    def calls(self) -> int:
+        """Calls made, shared or not"""
+        with self._lock:
+            return self._calls
+
+    def _join(self, key: Hashable) -> Tuple[Future, bool]:
+        """Return the key's future and whether the caller must run the call"""
+        with self._lock:
+            self._calls += 1
+            future = self._in_flight.get(key)
+            if future is not None:
+                self._shared += 1
+                return future, False
+            future = self._in_flight[key] = Future()
+            return future, True
+
+    def _finish(self, key: Hashable, future: Future, result: Any = None,
+                error: Optional[BaseException] = None):
+        with self._lock:
+            del self._in_flight[key]
+        if error is None:
+            future.set_result(result)
+        else:
+            future.set_exception(error)
+
+    def call(self, key: Hashable, fn: Callable[[], T], timeout: Optional[float] = None) -> T:
+        """
+        Run fn, or wait for the identical call already running.
+
+        Args:
+            key: Identifies identical calls (see request_key)
+            fn: The call to make if none is in flight
+            timeout: Most seconds to wait for another caller's call
+
+        Returns:
+            The call's result
+
+        Raises:
+            Whatever the call raised, in every caller.
+            concurrent.futures.TimeoutError if timeout runs out while waiting.
+        """
+        future, leader = self._join(key)
+        if not leader:
+            return future.result(timeout)
+
+        try:
+            result = fn()
+        except BaseException as e:
+            self._finish(key, future, error=e)
+            raise
+        self._finish(key, future, result)
+        return result
+
+    async def acall(self, key: Hashable, fn: Callable[[], T],
+                    executor: Optional[Executor] = None) -> T:
+        """
+        Async version of call(). fn is blocking and runs on a worker thread
+        of `executor` (the loop's default executor if None); tasks that
+        join an in-flight call wait without taking a thread.
+
+        Cancelling a task only cancels its own wait: the call keeps
+        running and every other caller still gets its result.
+        """
+        import asyncio  # Only async callers pay for it
+
+        future, leader = self._join(key)
+        if not leader:
+            # Shielded: cancelling this task must not cancel the shared future
+            return await asyncio.shield(asyncio.wrap_future(future))
+
+        def settle(done: 'asyncio.Future'):
+            # Runs when the worker thread finishes, even if the task that
+            # started it was cancelled, so joined callers still get the result
+            if done.cancelled():
+                self._finish(key, future, error=asyncio.CancelledError())
+            elif done.exception() is not None:
+                self._finish(key, future, error=done.exception())
+            else:
+                self._finish(key, future, done.result())
+
+        running = asyncio.get_running_loop().run_in_executor(executor, fn)
+        running.add_done_callback(settle)
+        return await asyncio.shield(running)
@@ -0,0 +1,129 @@
+"""
+OASTH Local Daemon
+==================
+Long-lived process that keeps a warm OasthAPI (session, connection pool,
+TLS connections) behind a Unix socket, so short-lived callers such as
+conky only pay for a local round trip.
+
+Protocol: one JSON object per line in each direction.
+
+    -> {"act": "arrivals", "stop": "3344"}
+    <- {"ok": true, "arrivals": [{...}, ...]}
+
+Other acts: "street" (merged board for a Street ID), "stats", "ping".
+"arrivals" and "street" take an optional "max_age" and "deadline" in
+seconds; arrivals carry "fetched_at" so the caller can count them down
+locally, and "stale" when a late or failed fetch fell back to the cache.
+"""
+
+import json
+import os
+import signal
+import socketserver
+from dataclasses import asdict
+from pathlib import Path
+
+from .daemon_client import SOCKET_PATH, _call
+from .paths import ensure_dir
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    """Serve newline-delimited JSON requests on one connection"""
+
+    def handle(self):
+        for raw in self.rfile:
+            try:
+                reply = self.server.dispatch(json.loads(raw))
+            except Exception as e:
+                reply = {'ok': False, 'error': str(e)}
+            self.wfile.write(json.dumps(reply, ensure_ascii=False).encode() + b'\n')
+            self.wfile.flush()
+
+
+class DaemonServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """Unix socket server sharing one OasthAPI between all clients"""
+
+    daemon_threads = True
+
+    def __init__(self, api, path: Path = SOCKET_PATH):
+        """
+        Initialize server.
+
+        Args:
+            api: The OasthAPI instance to keep warm
+            path: Socket path to listen on
+        """
+        self.api = api
+        self.path = Path(path)
+        ensure_dir(self.path.parent)
+        _remove_stale_socket(self.path)
+        super().__init__(str(self.path), _Handler)
+        os.chmod(self.path, 0o600)
+
+    def dispatch(self, request: dict) -> dict:
+        """Answer a single decoded request"""
+        act = request.get('act')
+        if act == 'ping':
+            return {'ok': True}
+        if act == 'stats':
+            cache = getattr(self.api, '_cache', None)
+            return {'ok': True, 'cache': asdict(cache.stats) if cache else None,
+                    'api': asdict(self.api.metrics)}
+        if act == 'arrivals':
+            arrivals = self.api.get_arrivals(str(request['stop']), request.get('max_age'),
+                                             request.get('deadline'))
+            return {'ok': True, 'arrivals': [asdict(a) for a in arrivals]}
+        if act == 'street':
+            arrivals = self.api.get_arrivals_for_street(str(request['street']),
+                                                        request.get('max_age'),
+                                                        request.get('deadline'))
+            return {'ok': True, 'arrivals': [asdict(a) for a in arrivals]}
+        raise ValueError(f"Unknown act: {act}")
+
+    def server_close(self):
+        super().server_close()
+        try:
+            self.path.unlink()
+        except FileNotFoundError:
+            pass
+
+
+def _remove_stale_socket(path: Path):
+    """Delete a socket file left behind by a daemon that is gone"""
+    if not path.exists():
+        return
+    if _call({'act': 'ping'}, path, timeout=1) is not None:
+        raise RuntimeError(f"Daemon already running on {path}")
+    path.unlink()
+
+
+def serve(path: Path = SOCKET_PATH, api=None):
+    """
+    Run the daemon until interrupted.
+
+    Args:
+        path: Socket path to listen on
+        api: Optional OasthAPI to serve. If None, a new one is created.
+    """
+    if api is None:
+        from .api import OasthAPI
+        from .cache import ArrivalCache
+        api = OasthAPI(cache=ArrivalCache())
+
+    # Pay for the session bootstrap now instead of on the first request,
+    # then keep renewing it ahead of expiry
+    from .session import SessionRenewer
+    api._ensure_session()
+    renewer = SessionRenewer(on_renew=api.set_session)
+    renewer.start()
+
+    # Treat SIGTERM like Ctrl-C so the socket file gets cleaned up
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+
+    with DaemonServer(api, path) as server:
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            renewer.stop()
@@ -0,0 +1,95 @@
+"""
+OASTH Daemon Client
+===================
+Talks to a running `cli.py --serve` daemon (see core.daemon).
+
+Kept separate from the server so short-lived callers only import the
+socket module.
+"""
+
+import json
+import socket
+from pathlib import Path
+from typing import List, Optional
+
+from .models import BusArrival
+from .paths import RUNTIME_DIR
+
+
+SOCKET_PATH = RUNTIME_DIR / 'oasth.sock'
+CLIENT_TIMEOUT = 15
+
+
+def _call(request: dict, path: Path = SOCKET_PATH,
+          timeout: float = CLIENT_TIMEOUT) -> Optional[dict]:
+    """Send one request, returning None if no daemon is listening"""
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.settimeout(timeout)
+            sock.connect(str(path))
+            sock.sendall(json.dumps(request).encode() + b'\n')
+            with sock.makefile('rb') as f:
+                line = f.readline()
+    except (FileNotFoundError, ConnectionRefusedError, socket.timeout):
+        return None
+    if not line:
+        return None
+    return json.loads(line)
+
+
+def fetch_stats(path: Path = SOCKET_PATH) -> Optional[dict]:
+    """
+    Get the daemon's counters, or None if no daemon is running.
+
+    Returns:
+        {"cache": arrivals cache counters, "api": retry/circuit breaker counters}
+    """
+    reply = _call({'act': 'stats'}, path)
+    if reply is None:
+        return None
+    return {'cache': reply.get('cache'), 'api': reply.get('api')}
+
+
+def fetch_arrivals(stop_code: str, path: Path = SOCKET_PATH, max_age: Optional[float] = None,
+                   deadline: Optional[float] = None) -> Optional[List[BusArrival]]:
+    """
+    Get arrivals through a running daemon.
+
+    Args:
+        stop_code: The stop code
+        path: Socket path of the daemon
+        max_age: Oldest cached response to accept, in seconds
+        deadline: Seconds the daemon may wait for the server
+
+    Returns:
+        List of bus arrivals, or None if no daemon is running
+    """
+    request = {'act': 'arrivals', 'stop': stop_code, 'max_age': max_age, 'deadline': deadline}
+    return _arrivals_reply(_call(request, path))
+
+
+def _arrivals_reply(reply: Optional[dict]) -> Optional[List[BusArrival]]:
+    if reply is None:
+        return None
+    if not reply.get('ok'):
+        raise RuntimeError(reply.get('error', 'daemon error'))
+    return [BusArrival(**a) for a in reply['arrivals']]
+
+
+def fetch_street_arrivals(street_id: str, path: Path = SOCKET_PATH,
+                          max_age: Optional[float] = None,
+                          deadline: Optional[float] = None) -> Optional[List[BusArrival]]:
+    """
+    Get merged arrivals for a Street ID through a running daemon.
+
+    Args:
+        street_id: The code on the stop sign
+        path: Socket path of the daemon
+        max_age: Oldest cached response to accept, in seconds
+        deadline: Seconds the daemon may wait for the server
+
+    Returns:
+        List of bus arrivals, or None if no daemon is running
+    """
+    request = {'act': 'street', 'street': street_id, 'max_age': max_age, 'deadline': deadline}
+    return _arrivals_reply(_call(request, path))
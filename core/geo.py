@@ -0,0 +1,258 @@
+"""
+OASTH Stop Locations
+====================
+Grid index over stop coordinates for nearest-stop and radius queries.
+
+Stops are bucketed into square cells of CELL_M metres and stored sorted by
+cell, so a query only looks at the handful of cells around the point. The
+index is persisted as a small JSON header (codes, names, grid parameters)
+followed by packed float/int arrays, which loads in a few milliseconds.
+"""
+
+import json
+import math
+import struct
+from array import array
+from bisect import bisect_left
+from pathlib import Path
+from typing import Iterable, List, Tuple
+
+from .models import BusStop
+from .paths import CACHE_DIR, ensure_dir
+
+
+INDEX_FILE = CACHE_DIR / 'stops_geo.bin'
+CELL_M = 250                 # Grid cell size in metres
+EARTH_RADIUS_M = 6371008.8
+METRES_PER_DEG_LAT = 111320.0
+_MAGIC = b'OASTHGEO1'
+
+
+def haversine_m(lat1: float, lng1: float, lat2: float, lng2: float) -> float:
+    """Great-circle distance between two points in metres"""
+    p1, p2 = math.radians(lat1), math.radians(lat2)
+    dp = p2 - p1
+    dl = math.radians(lng2 - lng1)
+    a = math.sin(dp / 2) ** 2 + math.cos(p1) * math.cos(p2) * math.sin(dl / 2) ** 2
+    return 2 * EARTH_RADIUS_M * math.asin(math.sqrt(a))
+
+
+class StopGeoIndex:
+    """Uniform grid over stop coordinates"""
+
+    def __init__(self, codes: List[str], names: List[str], lats: array, lngs: array,
+                 cell_keys: array, cell_starts: array, ref_lat: float):
+        """Use build() or load() rather than calling this directly"""
+        self._codes = codes
+        self._names = names
+        self._lats = lats
+        self._lngs = lngs
+        self._cell_keys = cell_keys      # Sorted, one per non-empty cell
+        self._cell_starts = cell_starts  # Offset of each cell's first stop, plus end
+        self.ref_lat = ref_lat
+        self._deg_lat = CELL_M / METRES_PER_DEG_LAT
+        self._deg_lng = CELL_M / (METRES_PER_DEG_LAT * math.cos(math.radians(ref_lat)))
+
+    def __len__(self) -> int:
+        return len(self._codes)
+
+    # -- construction ---------------------------------------------------
+
+    @classmethod
+    def build(cls, stops: Iterable[BusStop]) -> 'StopGeoIndex':
+        """
+        Build an index from stops with coordinates.
+
+        Stops without coordinates are skipped and duplicate codes are kept once.
+
+        Args:
+            stops: Stops to index
+        """
+        unique = {}
+        for stop in stops:
+            if stop.stop_lat and stop.stop_lng:
+                unique.setdefault(stop.stop_code, stop)
+        points = list(unique.values())
+        ref_lat = sum(s.stop_lat for s in points) / len(points) if points else 40.64
+
+        index = cls([], [], array('d'), array('d'), array('q'), array('I'), ref_lat)
+        points.sort(key=lambda s: index._cell_key(s.stop_lat, s.stop_lng))
+
+        for i, stop in enumerate(points):
+            key = index._cell_key(stop.stop_lat, stop.stop_lng)
+            if not index._cell_keys or index._cell_keys[-1] != key:
+                index._cell_keys.append(key)
+                index._cell_starts.append(i)
+            index._codes.append(stop.stop_code)
+            index._names.append(stop.stop_descr)
+            index._lats.append(stop.stop_lat)
+            index._lngs.append(stop.stop_lng)
+        index._cell_starts.append(len(points))
+        return index
+
+    def save(self, path: Path = INDEX_FILE):
+        """Write the index to disk atomically"""
+        header = json.dumps({
+            'ref_lat': self.ref_lat,
+            'codes': self._codes,
+            'names': self._names,
+            'cells': len(self._cell_keys),
+        }, ensure_ascii=False).encode('utf-8')
+
+        path = Path(path)
+        ensure_dir(path.parent)
+        tmp = path.with_suffix('.tmp')
+        with open(tmp, 'wb') as f:
+            f.write(_MAGIC + struct.pack('<I', len(header)) + header)
+            for arr in (self._lats, self._lngs, self._cell_keys, self._cell_starts):
+                arr.tofile(f)
+        tmp.replace(path)
+
+    @classmethod
+    def load(cls, path: Path = INDEX_FILE) -> 'StopGeoIndex':
+        """Read an index written by save()"""
+        with open(path, 'rb') as f:
+            if f.read(len(_MAGIC)) != _MAGIC:
+                raise ValueError(f"{path} is not a stop location index")
+            (size,) = struct.unpack('<I', f.read(4))
+            header = json.loads(f.read(size))
+            n, cells = len(header['codes']), header['cells']
+
+            arrays = []
+            for typecode, count in (('d', n), ('d', n), ('q', cells), ('I', cells + 1)):
+                arr = array(typecode)
+                arr.fromfile(f, count)
+                arrays.append(arr)
+
+        return cls(header['codes'], header['names'], *arrays, header['ref_lat'])
+
+    # -- queries --------------------------------------------------------
+
+    def _cell(self, lat: float, lng: float) -> Tuple[int, int]:
+        return math.floor(lat / self._deg_lat), math.floor(lng / self._deg_lng)
+
+    def _cell_key(self, lat: float, lng: float) -> int:
+        row, col = self._cell(lat, lng)
+        return (row << 32) | (col & 0xFFFFFFFF)
+
+    def _cell_members(self, row: int, col: int) -> range:
+        key = (row << 32) | (col & 0xFFFFFFFF)
+        i = bisect_left(self._cell_keys, key)
+        if i < len(self._cell_keys) and self._cell_keys[i] == key:
+            return range(self._cell_starts[i], self._cell_starts[i + 1])
+        return range(0)
+
+    def _stop(self, i: int) -> BusStop:
+        return BusStop(stop_code=self._codes[i], stop_descr=self._names[i],
+                       stop_lat=self._lats[i], stop_lng=self._lngs[i])
+
+    def within(self, lat: float, lng: float, radius_m: float) -> List[Tuple[BusStop, float]]:
+        """
+        Find every stop within a radius.
+
+        Args:
+            lat: Latitude of the point
+            lng: Longitude of the point
+            radius_m: Search radius in metres
+
+        Returns:
+            (stop, distance in metres) pairs, nearest first
+        """
+        row, col = self._cell(lat, lng)
+        reach = math.ceil(radius_m / CELL_M)
+        found = []
+        for r in range(row - reach, row + reach + 1):
+            for c in range(col - reach, col + reach + 1):
+                for i in self._cell_members(r, c):
+                    d = haversine_m(lat, lng, self._lats[i], self._lngs[i])
+                    if d <= radius_m:
+                        found.append((d, i))
+        found.sort()
+        return [(self._stop(i), d) for d, i in found]
+
+    def nearest(self, lat: float, lng: float, k: int = 5,
+                max_radius_m: float = 20000) -> List[Tuple[BusStop, float]]:
+        """
+        Find the k stops closest to a point.
+
+        Searches rings of cells outwards and stops once no unvisited cell
+        can hold anything closer than the k-th best match.
+
+        Args:
+            lat: Latitude of the point
+            lng: Longitude of the point
+            k: Number of stops to return
+            max_radius_m: Give up looking beyond this distance
+
+        Returns:
+            (stop, distance in metres) pairs, nearest first
+        """
+        if k <= 0 or not self._codes:
+            return []
+
+        row, col = self._cell(lat, lng)
+        best = []
+        ring = 0
+        max_ring = math.ceil(max_radius_m / CELL_M)
+        while ring <= max_ring:
+            for r in range(row - ring, row + ring + 1):
+                edge = r in (row - ring, row + ring)
+                step = 1 if edge else 2 * ring
+                for c in range(col - ring, col + ring + 1, step):
+                    for i in self._cell_members(r, c):
+                        best.append((haversine_m(lat, lng, self._lats[i], self._lngs[i]), i))
+            best.sort()
+            del best[k:]
+            # Anything in ring+1 is at least ring * CELL_M away
+            if len(best) == k and best[-1][0] <= ring * CELL_M:
+                break
+            ring += 1
+        return [(self._stop(i), d) for d, i in best if d <= max_radius_m]
+
+
+def collect_stops(api, workers: int = 8) -> List[BusStop]:
+    """
+    Fetch every stop with coordinates by walking lines -> routes -> stops.
+
+    Args:
+        api: An OasthAPI
+        workers: Requests in flight
+
+    Returns:
+        Unique stops
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        lines = api.get_lines()
+        route_lists = pool.map(api.get_routes_for_line, [l.line_code for l in lines])
+        route_codes = {r.route_code for routes in route_lists for r in routes}
+        stop_lists = pool.map(api.get_stops_for_route, sorted(route_codes))
+        stops = {}
+        for route_stops in stop_lists:
+            for stop in route_stops:
+                stops.setdefault(stop.stop_code, stop)
+    return list(stops.values())
+
+
+def load_geo_index(path: Path = INDEX_FILE, api=None) -> StopGeoIndex:
+    """
+    Load the persisted index, building and saving it first if needed.
+
+    Args:
+        path: Index file
+        api: OasthAPI used to fetch stops if the index must be built.
+            If None, a new one is created.
+    """
+    try:
+        return StopGeoIndex.load(path)
+    except (OSError, ValueError):
+        pass
+
+    if api is None:
+        from .api import OasthAPI
+        from .cache import MetadataCache
+        api = OasthAPI(metadata_cache=MetadataCache())
+    index = StopGeoIndex.build(collect_stops(api))
+    index.save(path)
+    return index
@@ -0,0 +1,105 @@
+"""
+Incremental JSON Array Parsing
+==============================
+Yields the elements of a top-level JSON array while its body is still
+arriving, so large catalogue responses (webGetLinesWithMLInfo) never have
+to sit in memory whole, either as bytes or as one decoded list.
+
+Each element is decoded with json.JSONDecoder.raw_decode as soon as the
+buffered text holds all of it; consumed text is dropped from the buffer.
+Peak memory is one chunk plus the largest element.
+"""
+
+import codecs
+import json
+from typing import Any, Iterable, Iterator
+
+_WHITESPACE = ' \t\n\r'
+_NUMBER_CHARS = '0123456789.eE+-'  # Characters that can continue a number
+_COMPACT_AT = 64 * 1024  # Drop consumed text once this much has piled up
+
+
+def iter_json_array(chunks: Iterable[bytes], encoding: str = 'utf-8') -> Iterator[Any]:
+    """
+    Decode the elements of a JSON array from a stream of byte chunks.
+
+    Args:
+        chunks: The response body, in pieces of any size
+        encoding: Body encoding
+
+    Yields:
+        Each element of the array, in order. A body that is not an array
+        (null, an error object) yields nothing.
+
+    Raises:
+        json.JSONDecodeError: The body is not valid JSON
+    """
+    decoder = json.JSONDecoder()
+    text = codecs.getincrementaldecoder(encoding)()
+    chunks = iter(chunks)
+    buf = ''
+    pos = 0
+    eof = False
+
+    def more() -> bool:
+        """Append the next chunk to buf; False at the end of the body"""
+        nonlocal buf, pos, eof
+        if eof:
+            return False
+        chunk = next(chunks, None)
+        if pos >= _COMPACT_AT:
+            buf, pos = buf[pos:], 0
+        if chunk is None:
+            eof = True
+            buf += text.decode(b'', final=True)
+        else:
+            buf += text.decode(chunk)
+        return True
+
+    def skip(chars: str) -> bool:
+        """Advance pos past chars; False if the body ends first"""
+        nonlocal pos
+        while True:
+            while pos < len(buf) and buf[pos] in chars:
+                pos += 1
+            if pos < len(buf):
+                return True
+            if not more():
+                return False
+
+    if not skip(_WHITESPACE + '\ufeff') or buf[pos] != '[':
+        return
+    pos += 1
+
+    first = True
+    while skip(_WHITESPACE):
+        if buf[pos] == ']':
+            return
+        if not first:
+            if buf[pos] != ',':
+                raise json.JSONDecodeError("Expecting ',' delimiter", buf, pos)
+            pos += 1
+            if not skip(_WHITESPACE):
+                break
+        first = False
+
+        while True:
+            try:
+                value, end = decoder.raw_decode(buf, pos)
+            except json.JSONDecodeError:
+                if more():
+                    continue
+                raise
+            # A number or literal that ends with the buffer may continue in
+            # the next chunk ("12" then "3"): only trust it once more text is in.
+            # raw_decode also stops a number before a trailing ".", "e" or "-"
+            # it cannot parse yet ("-4." gives -4), so those wait too.
+            if end == len(buf) or (type(value) in (int, float)
+                                   and all(c in _NUMBER_CHARS for c in buf[end:])):
+                if more():
+                    continue
+            break
+        pos = end
+        yield value
+
+    raise json.JSONDecodeError("Unterminated array", buf, pos)
@@ -0,0 +1,172 @@
+"""
+OASTH Line and Route Names
+==========================
+Offline names for line IDs and route codes, so arrivals can be described
+without another request.
+
+Names come from the bundled lines.json and routes.json, overlaid with the
+catalogue responses in the metadata cache when there are any (those are
+newer). Everything is loaded on first lookup and memoized; a long-lived
+process picks up a changed metadata cache within CHECK_INTERVAL seconds.
+"""
+
+import json
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from .cache import MetadataCache
+from .models import BusArrival
+from .paths import ASSETS_DIR
+
+
+LINES_FILE = ASSETS_DIR / 'lines.json'
+ROUTES_FILE = ASSETS_DIR / 'routes.json'
+CHECK_INTERVAL = 300  # Seconds between checks of the metadata cache
+
+
+def _load_asset(path: Path) -> Dict[str, str]:
+    try:
+        with open(path, encoding='utf-8') as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    return data if isinstance(data, dict) else {}
+
+
+class MetadataLookup:
+    """Memoized line and route names"""
+
+    def __init__(self, lines_file: Path = LINES_FILE, routes_file: Path = ROUTES_FILE,
+                 cache: Optional[MetadataCache] = None):
+        """
+        Initialize lookup.
+
+        Args:
+            lines_file: Bundled line ID -> description map
+            routes_file: Bundled route code -> description map
+            cache: Optional metadata cache to overlay on the bundled files
+        """
+        self._lines_file = lines_file
+        self._routes_file = routes_file
+        self._cache = cache
+        self._lock = threading.Lock()
+        self._lines: Optional[Dict[str, str]] = None
+        self._routes: Optional[Dict[str, str]] = None
+        self._cached_routes: Optional[Dict[str, str]] = None  # Read on first miss
+        self._generation = None
+        self._checked = 0.0
+
+    def _cache_generation(self):
+        """Changes whenever the metadata cache gets new content"""
+        cache = self._cache
+        try:
+            mtime = cache.path.stat().st_mtime  # New entries are renamed in
+        except OSError:
+            mtime = None
+        return mtime, cache.digest('webGetLines'), cache.digest('webGetLinesWithMLInfo')
+
+    def _check(self):
+        """Forget memoized names if the metadata cache changed since they were loaded"""
+        if self._cache is None:
+            return
+        now = time.monotonic()
+        if self._lines is not None and now - self._checked < CHECK_INTERVAL:
+            return
+        self._checked = now
+        generation = self._cache_generation()
+        if generation != self._generation:
+            self._generation = generation
+            self._lines = self._routes = self._cached_routes = None
+
+    def _line_map(self) -> Dict[str, str]:
+        with self._lock:
+            self._check()
+            if self._lines is None:
+                lines = _load_asset(self._lines_file)
+                if self._cache is not None:
+                    for act, k_id, k_descr in (('webGetLinesWithMLInfo', 'line_id', 'line_descr'),
+                                               ('webGetLines', 'LineID', 'LineDescr')):
+                        entry = self._cache.read(act)
+                        for item in (entry[1] if entry else ()):
+                            if isinstance(item, dict) and item.get(k_id) and item.get(k_descr):
+                                lines[item[k_id]] = item[k_descr]
+                self._lines = lines
+            return self._lines
+
+    def _route_map(self) -> Dict[str, str]:
+        with self._lock:
+            self._check()
+            if self._routes is None:
+                self._routes = _load_asset(self._routes_file)
+            return self._routes
+
+    def _cached_route_map(self) -> Dict[str, str]:
+        """Route names from every cached webGetRoutesForLine answer"""
+        with self._lock:
+            if self._cached_routes is None:
+                routes = {}
+                if self._cache is not None and self._cache.path.exists():
+                    for path in self._cache.path.glob('webGetRoutesForLine-*.json'):
+                        entry = self._cache.read(path.stem)
+                        for item in (entry[1] if entry else ()):
+                            if isinstance(item, dict) and item.get('RouteCode'):
+                                routes[str(item['RouteCode'])] = item.get('RouteDescr') or ''
+                self._cached_routes = routes
+            return self._cached_routes
+
+    def line_descr(self, line_id: str) -> Optional[str]:
+        """
+        Description of a line, or None if unknown.
+
+        Like the Android LineRepository, IDs are tried as given, trimmed
+        and with a leading space, since the API writes " 1N" and "1N".
+        """
+        lines = self._line_map()
+        for key in (line_id, line_id.strip(), f" {line_id.strip()}"):
+            descr = lines.get(key)
+            if descr:
+                return descr.strip()
+        return None
+
+    def route_descr(self, route_code: str) -> Optional[str]:
+        """Description of a route, or None if unknown"""
+        route_code = str(route_code)
+        descr = self._route_map().get(route_code)
+        if descr is None:
+            descr = self._cached_route_map().get(route_code)
+        return descr.strip() if descr else None
+
+    def enrich(self, arrivals: List[BusArrival]) -> List[BusArrival]:
+        """
+        Fill in missing line and route descriptions, in place.
+
+        Returns:
+            The same arrivals
+        """
+        for a in arrivals:
+            if not a.line_descr:
+                a.line_descr = self.line_descr(a.line_id) or ''
+            if not a.route_descr and a.route_code:
+                a.route_descr = self.route_descr(a.route_code) or ''
+        return arrivals
+
+
+_default = None
+_default_lock = threading.Lock()
+
+
+def default_lookup() -> MetadataLookup:
+    """Process-wide lookup over the bundled assets and the user's metadata cache"""
+    global _default
+    if _default is None:
+        with _default_lock:
+            if _default is None:
+                _default = MetadataLookup(cache=MetadataCache())
+    return _default
+
+
+def enrich_arrivals(arrivals: List[BusArrival]) -> List[BusArrival]:
+    """Fill in missing line and route descriptions (see MetadataLookup.enrich)"""
+    return default_lookup().enrich(arrivals)
@@ -2,34 +2,107 @@
 OASTH Data Models
 =================
 Data structures for bus arrivals, stops, and lines.
+
+Models use __slots__ (on Python 3.10+) and intern the strings that repeat
+across responses (line IDs, descriptions), so city-wide snapshots stay
+small. Metadata models are frozen; BusArrival stays mutable because it is
+built in the hot path, where frozen construction costs about twice as much.
+For whole responses, ArrivalBatch stores the data column-wise.
 """
 
-from dataclasses import dataclass
-from typing import List, Optional
+import sys
+import time
+from array import array
+from dataclasses import dataclass, replace
+from typing import Iterator, List, Optional, Sequence, Tuple
+
+_SLOTS = {'slots': True} if sys.version_info >= (3, 10) else {}
+
+
+def _intern(value) -> str:
+    """Interned copy of a string field (None becomes '')"""
+    if type(value) is str:
+        return sys.intern(value)
+    return '' if value is None else str(value)
+
+# Key names of the arrival fields, per response schema: (line id, line
+# description, route code, vehicle code, minutes)
+_ARRIVAL_SCHEMAS = (
+    ('bline_id', 'bline_descr', 'route_code', 'veh_code', 'btime2'),   # getStopArrivals
+    ('line_id', 'line_descr', 'route_code', 'veh_code', 'estimated_time'),
+)
+
+
+def _arrival_schema(data: dict) -> Tuple[str, ...]:
+    """Key names used by an arrival record"""
+    for schema in _ARRIVAL_SCHEMAS:
+        if schema[0] in data:
+            return schema
+    return _ARRIVAL_SCHEMAS[0]
 
 
-@dataclass
+@dataclass(**_SLOTS)
 class BusArrival:
     """A bus arrival at a stop"""
     line_id: str           # e.g., "01", "31"
     line_descr: str        # Line description
     route_code: str        # Internal route code
     vehicle_code: str      # Bus vehicle code
-    estimated_minutes: int # Minutes until arrival
+    estimated_minutes: int # Minutes until arrival, as of fetched_at
+    fetched_at: float = 0.0  # Unix time the estimate was fetched (0 if unknown)
+    stale: bool = False      # Served from cache because a fresh fetch failed or was late
+    route_descr: str = ''    # Route name, filled in by core.lookup (the API does not send it)
     
     @classmethod
-    def from_api(cls, data: dict) -> 'BusArrival':
+    def from_api(cls, data: dict, fetched_at: float = 0.0, stale: bool = False) -> 'BusArrival':
         """Create from API response"""
-        return cls(
-            line_id=data.get('bline_id', data.get('line_id', '')),
-            line_descr=data.get('bline_descr', data.get('line_descr', '')),
-            route_code=data.get('route_code', ''),
-            vehicle_code=data.get('veh_code', ''),
-            estimated_minutes=int(data.get('btime2', data.get('estimated_time', 0)))
-        )
+        return cls.from_api_list([data], fetched_at, stale)[0]
+    
+    @classmethod
+    def from_api_list(cls, items: Sequence[dict], fetched_at: float = 0.0,
+                      stale: bool = False) -> List['BusArrival']:
+        """
+        Create from a whole getStopArrivals response.
+        
+        The key names are looked up once for the response rather than
+        once per field of every record.
+        """
+        if not items:
+            return []
+        k_line, k_descr, k_route, k_veh, k_time = _arrival_schema(items[0])
+        return [
+            cls(_intern(d.get(k_line, '')), _intern(d.get(k_descr, '')),
+                d.get(k_route, ''), d.get(k_veh, ''), int(d.get(k_time, 0)),
+                fetched_at, stale)
+            for d in items
+        ]
+    
+    def age(self, now: Optional[float] = None) -> float:
+        """Seconds since the estimate was fetched"""
+        if not self.fetched_at:
+            return 0.0
+        return max(0.0, (now or time.time()) - self.fetched_at)
+    
+    def minutes_at(self, now: Optional[float] = None) -> int:
+        """Estimated minutes left at `now`, counted down from the fetch time"""
+        return max(0, self.estimated_minutes - int(self.age(now) // 60))
+    
+    def projected(self, now: Optional[float] = None) -> 'BusArrival':
+        """
+        Copy with estimated_minutes projected to `now`.
+        
+        fetched_at moves forward by the whole minutes counted down, so
+        projecting an already projected arrival gives the same result.
+        """
+        gone = int(self.age(now) // 60)
+        if gone == 0 or self.estimated_minutes == 0:
+            return self
+        gone = min(gone, self.estimated_minutes)
+        return replace(self, estimated_minutes=self.estimated_minutes - gone,
+                       fetched_at=self.fetched_at + gone * 60)
 
 
-@dataclass
+@dataclass(frozen=True, **_SLOTS)
 class BusStop:
     """A bus stop"""
     stop_code: str        # e.g., "3344"
@@ -48,7 +121,7 @@ class BusStop:
         )
 
 
-@dataclass
+@dataclass(frozen=True, **_SLOTS)
 class BusLine:
     """A bus line"""
     line_code: str        # Internal code
@@ -60,6 +133,141 @@ class BusLine:
         """Create from API response"""
         return cls(
             line_code=data.get('LineCode', data.get('line_code', '')),
-            line_id=data.get('LineID', data.get('line_id', '')).strip(),
-            line_descr=data.get('LineDescr', data.get('line_descr', ''))
+            line_id=_intern(data.get('LineID', data.get('line_id', '')).strip()),
+            line_descr=_intern(data.get('LineDescr', data.get('line_descr', '')))
+        )
+
+
+@dataclass(frozen=True, **_SLOTS)
+class BusLineInfo:
+    """A bus line with its master line info, from webGetLinesWithMLInfo"""
+    line_code: str        # Internal code
+    line_id: str          # Public ID (e.g., "01", "31")
+    line_descr: str       # Description (Greek)
+    line_descr_eng: str   # Description (English)
+    ml_code: str          # Master line the line belongs to
+    sdc_code: str         # Schedule code
+    is_master: bool       # Whether this is the master line itself
+    
+    @classmethod
+    def from_api(cls, data: dict) -> 'BusLineInfo':
+        """Create from API response"""
+        return cls(
+            line_code=data.get('line_code', data.get('LineCode', '')),
+            line_id=_intern((data.get('line_id', data.get('LineID')) or '').strip()),
+            line_descr=_intern(data.get('line_descr', data.get('LineDescr', ''))),
+            line_descr_eng=_intern(data.get('line_descr_eng', data.get('LineDescrEng', ''))),
+            ml_code=data.get('ml_code', ''),
+            sdc_code=data.get('sdc_code', ''),
+            is_master=str(data.get('mld_master', '')) == '1'
+        )
+
+
+@dataclass(frozen=True, **_SLOTS)
+class BusRoute:
+    """A route (one direction or variant) of a line"""
+    route_code: str       # Internal code
+    line_code: str        # Internal code of the line
+    route_descr: str      # Description, e.g. "Κ.Τ.Ε.Λ. - ΒΟΥΛΓΑΡΗ"
+    
+    @classmethod
+    def from_api(cls, data: dict) -> 'BusRoute':
+        """Create from API response"""
+        return cls(
+            route_code=str(data.get('RouteCode', data.get('route_code', ''))),
+            line_code=str(data.get('LineCode', data.get('line_code', ''))),
+            route_descr=data.get('RouteDescr', data.get('route_descr', ''))
         )
+
+
+@dataclass(frozen=True, **_SLOTS)
+class StreetStop:
+    """A physical stop as signposted, from stops.json"""
+    street_id: str        # Code shown on the stop sign (e.g., "1403")
+    stop_descr: str       # Stop name
+    api_ids: List[str]    # Stop codes accepted by getStopArrivals
+    
+    @classmethod
+    def from_asset(cls, data: dict) -> 'StreetStop':
+        """Create from a stops.json entry"""
+        return cls(
+            street_id=data.get('StreetID', ''),
+            stop_descr=(data.get('StopDescr') or '').strip(),
+            api_ids=list(data.get('API_IDs') or [])
+        )
+
+
+class ArrivalBatch:
+    """
+    Arrivals stored column-wise, for one response or a city-wide sweep.
+    
+    Strings live once in a table shared by the batch and are referenced by
+    index; minutes are a packed array. Iterating yields BusArrival objects
+    on demand. All rows share one fetch time.
+    """
+    
+    __slots__ = ('fetched_at', 'stale', 'strings', 'line_ids', 'line_descrs',
+                 'route_codes', 'vehicle_codes', 'minutes', '_index')
+    
+    def __init__(self, fetched_at: float = 0.0, stale: bool = False):
+        self.fetched_at = fetched_at
+        self.stale = stale
+        self.strings: List[str] = []       # String table
+        self.line_ids = array('I')         # Indexes into strings
+        self.line_descrs = array('I')
+        self.route_codes = array('I')
+        self.vehicle_codes = array('I')
+        self.minutes = array('i')
+        self._index = {}                   # String -> position in strings
+    
+    @classmethod
+    def from_api(cls, items: Sequence[dict], fetched_at: float = 0.0,
+                 stale: bool = False) -> 'ArrivalBatch':
+        """Create from a getStopArrivals response"""
+        batch = cls(fetched_at, stale)
+        batch.extend(items)
+        return batch
+    
+    def extend(self, items: Sequence[dict]):
+        """Append the records of a getStopArrivals response in one pass"""
+        if not items:
+            return
+        strings = self.strings
+        index = self._index
+        
+        def ref(value) -> int:
+            i = index.get(value)
+            if i is None:
+                i = index[value] = len(strings)
+                strings.append(_intern(value))
+            return i
+        
+        k_line, k_descr, k_route, k_veh, k_time = _arrival_schema(items[0])
+        line_ids, line_descrs = self.line_ids.append, self.line_descrs.append
+        route_codes, vehicle_codes = self.route_codes.append, self.vehicle_codes.append
+        minutes = self.minutes.append
+        for d in items:
+            line_ids(ref(d.get(k_line, '')))
+            line_descrs(ref(d.get(k_descr, '')))
+            route_codes(ref(d.get(k_route, '')))
+            vehicle_codes(ref(d.get(k_veh, '')))
+            minutes(int(d.get(k_time, 0)))
+    
+    def __len__(self) -> int:
+        return len(self.minutes)
+    
+    def __getitem__(self, i: int) -> BusArrival:
+        s = self.strings
+        return BusArrival(s[self.line_ids[i]], s[self.line_descrs[i]], s[self.route_codes[i]],
+                          s[self.vehicle_codes[i]], self.minutes[i], self.fetched_at, self.stale)
+    
+    def __iter__(self) -> Iterator[BusArrival]:
+        return (self[i] for i in range(len(self)))
+    
+    def to_list(self) -> List[BusArrival]:
+        """All arrivals as objects"""
+        return list(self)
+    
+    def soonest(self) -> Optional[int]:
+        """Smallest estimate in minutes, or None if empty"""
+        return min(self.minutes) if self.minutes else None
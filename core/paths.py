@@ -0,0 +1,21 @@
+"""
+OASTH Paths
+===========
+Where the library keeps its per-user state.
+"""
+
+import os
+from pathlib import Path
+
+
+# Bundled data shared with the Android app (stops.json, lines.json, routes.json)
+ASSETS_DIR = Path(__file__).resolve().parent.parent / 'android' / 'app' / 'src' / 'main' / 'assets'
+
+CACHE_DIR = Path(os.environ.get('XDG_CACHE_HOME', Path.home() / '.cache')) / 'oasth'
+RUNTIME_DIR = Path(os.environ.get('XDG_RUNTIME_DIR', CACHE_DIR))
+
+
+def ensure_dir(path: Path) -> Path:
+    """Create a private directory if it does not exist yet"""
+    path.mkdir(mode=0o700, parents=True, exist_ok=True)
+    return path
@@ -0,0 +1,329 @@
+"""
+OASTH Request Resilience
+========================
+Retry, rate limiting and circuit breaking around OasthAPI requests.
+
+- Transient failures (timeouts, connection errors, 429 and 5xx) are
+  retried with exponential backoff and full jitter, so a fan-out of
+  workers does not retry in lockstep.
+- Rate limits are opt-in: an `act` given a limit (or every act, with
+  default_rate) gets its own token bucket, so one busy endpoint cannot
+  starve the others or flood the server. Without one, concurrency is
+  bounded only by the caller's worker count.
+- A circuit breaker watches the recent error rate. Once it crosses the
+  threshold, requests fail fast with CircuitOpenError (callers with a
+  cache fall back to it) until a probe after the cooldown succeeds.
+- Latency is tracked per act, so a request that runs past the usual p95
+  can be hedged with a duplicate (see OasthAPI.get_arrivals(deadline=)).
+"""
+
+import threading
+import time
+from collections import deque
+from dataclasses import asdict, dataclass, field
+from typing import Callable, Dict, Optional, Tuple, TypeVar
+
+from .transport import HTTPStatusError, TransportError
+
+T = TypeVar('T')
+
+DEFAULT_ATTEMPTS = 3          # Tries per request, including the first
+DEFAULT_BASE_DELAY = 0.25     # Seconds before the first retry (before jitter)
+DEFAULT_MAX_DELAY = 4.0       # Cap on any single backoff
+ERROR_THRESHOLD = 0.5         # Error rate that opens the circuit
+WINDOW = 20                   # Recent requests the error rate is taken over
+MIN_CALLS = 5                 # Don't judge the error rate on fewer requests
+COOLDOWN = 30                 # Seconds the circuit stays open before a probe
+LATENCY_SAMPLES = 200         # Recent latencies kept per act
+MIN_LATENCY_SAMPLES = 20      # Below this, hedge after DEFAULT_HEDGE_DELAY
+DEFAULT_HEDGE_DELAY = 0.5     # Seconds
+MIN_HEDGE_DELAY = 0.05        # Never hedge sooner than this
+MAX_HEDGE_RATE = 0.1          # At most this share of requests get a hedge
+
+CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half_open'
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling the server while the circuit is open"""
+
+
+class DeadlineExceeded(TimeoutError):
+    """Raised when no answer arrived in time and nothing is cached"""
+
+
+def is_transient(error: BaseException) -> bool:
+    """True for failures worth retrying: timeouts, dropped connections, 429 and 5xx"""
+    if isinstance(error, HTTPStatusError):
+        return error.status_code == 429 or error.status_code >= 500
+    return isinstance(error, TransportError)
+
+
+@dataclass
+class RetryPolicy:
+    """Exponential backoff with full jitter"""
+    attempts: int = DEFAULT_ATTEMPTS
+    base_delay: float = DEFAULT_BASE_DELAY
+    max_delay: float = DEFAULT_MAX_DELAY
+
+    def delay(self, retry: int) -> float:
+        """Seconds to wait before retry number `retry` (0-based)"""
+        import random
+
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** retry))
+
+
+class TokenBucket:
+    """Thread-safe token bucket"""
+
+    def __init__(self, rate: float, burst: float):
+        """
+        Initialize bucket.
+
+        Args:
+            rate: Tokens added per second
+            burst: Most tokens the bucket holds
+        """
+        self.rate = rate
+        self.burst = max(1.0, burst)
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> float:
+        """Take one token, waiting for it if needed. Returns seconds waited."""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            # Reserve the token now, so concurrent callers queue up behind it
+            self._tokens -= 1
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0.0
+        if wait:
+            time.sleep(wait)
+        return wait
+
+
+class CircuitBreaker:
+    """Opens after too many recent failures, then probes to close again"""
+
+    def __init__(self, threshold: float = ERROR_THRESHOLD, window: int = WINDOW,
+                 min_calls: int = MIN_CALLS, cooldown: float = COOLDOWN):
+        """
+        Initialize breaker.
+
+        Args:
+            threshold: Error rate (0-1) over the window that opens the circuit
+            window: Number of recent outcomes considered
+            min_calls: Outcomes needed before the circuit may open
+            cooldown: Seconds to stay open before letting one probe through
+        """
+        self.threshold = threshold
+        self.min_calls = min_calls
+        self.cooldown = cooldown
+        self._outcomes = deque(maxlen=window)
+        self._state = CLOSED
+        self._opened_at = 0.0
+        self._probing = False
+        self._transitions: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._state
+
+    @property
+    def transitions(self) -> Dict[str, int]:
+        """How often each transition happened, e.g. {"closed->open": 2}"""
+        with self._lock:
+            return dict(self._transitions)
+
+    def _set(self, state: str):
+        if state != self._state:
+            key = f"{self._state}->{state}"
+            self._transitions[key] = self._transitions.get(key, 0) + 1
+            self._state = state
+
+    def allow(self):
+        """Raise CircuitOpenError unless a request may go out now"""
+        with self._lock:
+            if self._state == OPEN and time.monotonic() - self._opened_at >= self.cooldown:
+                self._set(HALF_OPEN)
+            if self._state == CLOSED:
+                return
+            if self._state == HALF_OPEN and not self._probing:
+                self._probing = True  # Exactly one probe at a time
+                return
+            raise CircuitOpenError("OASTH API unavailable, circuit open")
+
+    def record(self, ok: bool):
+        """Report the outcome of a request that allow() let through"""
+        with self._lock:
+            if self._state == HALF_OPEN:
+                self._probing = False
+                self._outcomes.clear()
+                if ok:
+                    self._set(CLOSED)
+                else:
+                    self._opened_at = time.monotonic()
+                    self._set(OPEN)
+                return
+
+            self._outcomes.append(ok)
+            failures = self._outcomes.count(False)
+            if (self._state == CLOSED and len(self._outcomes) >= self.min_calls
+                    and failures / len(self._outcomes) >= self.threshold):
+                self._opened_at = time.monotonic()
+                self._set(OPEN)
+
+
+class LatencyTracker:
+    """Recent request latencies per act"""
+
+    def __init__(self, samples: int = LATENCY_SAMPLES):
+        """
+        Initialize tracker.
+
+        Args:
+            samples: Latencies kept per act
+        """
+        self._samples = samples
+        self._latencies: Dict[str, deque] = {}
+        self._lock = threading.Lock()
+
+    def record(self, act: str, seconds: float):
+        """Add the latency of one successful request"""
+        with self._lock:
+            if act not in self._latencies:
+                self._latencies[act] = deque(maxlen=self._samples)
+            self._latencies[act].append(seconds)
+
+    def p95(self, act: str) -> Optional[float]:
+        """95th percentile latency of an act, or None with too few samples"""
+        with self._lock:
+            latencies = sorted(self._latencies.get(act, ()))
+        if len(latencies) < MIN_LATENCY_SAMPLES:
+            return None
+        return latencies[int(len(latencies) * 0.95)]
+
+
+@dataclass
+class ResilienceStats:
+    """Counters for watching how the client copes with a struggling server"""
+    requests: int = 0           # Attempts sent, including retries
+    retries: int = 0            # Attempts that were retries
+    failures: int = 0           # Requests that failed after all retries
+    short_circuits: int = 0     # Requests refused while the circuit was open
+    throttle_wait: float = 0.0  # Seconds spent waiting on rate limits
+    hedges: int = 0             # Duplicate requests sent for slow answers
+    hedge_wins: int = 0         # Hedges that answered first
+    deadline_misses: int = 0    # Deadlines that ran out (cached board served)
+    coalesced: int = 0          # Requests that joined an identical one in flight
+    circuit: str = CLOSED       # Current breaker state
+    transitions: Dict[str, int] = field(default_factory=dict)  # "closed->open": count
+
+
+class Resilience:
+    """Retry policy, per-act rate limits and a circuit breaker for one client"""
+
+    def __init__(self, retry: Optional[RetryPolicy] = None,
+                 rate_limits: Optional[Dict[str, Tuple[float, float]]] = None,
+                 default_rate: Optional[Tuple[float, float]] = None,
+                 breaker: Optional[CircuitBreaker] = None,
+                 max_hedge_rate: float = MAX_HEDGE_RATE):
+        """
+        Initialize.
+
+        Args:
+            retry: Retry policy (defaults to RetryPolicy())
+            rate_limits: (requests per second, burst) per act
+            default_rate: (requests per second, burst) for acts not listed.
+                If None (the default), unlisted acts are not rate limited.
+            breaker: Circuit breaker (defaults to CircuitBreaker())
+            max_hedge_rate: Most hedges allowed per request sent (0-1)
+        """
+        self.retry = retry or RetryPolicy()
+        self._rate_limits = dict(rate_limits or {})
+        self._default_rate = default_rate
+        self._buckets: Dict[str, Optional[TokenBucket]] = {}
+        self._stats = ResilienceStats()
+        self._lock = threading.Lock()
+        self.breaker = breaker or CircuitBreaker()
+        self.latency = LatencyTracker()
+        self.max_hedge_rate = max_hedge_rate
+
+    @property
+    def stats(self) -> ResilienceStats:
+        """Snapshot of the counters"""
+        with self._lock:
+            stats = ResilienceStats(**asdict(self._stats))
+        stats.circuit = self.breaker.state
+        stats.transitions = self.breaker.transitions
+        return stats
+
+    def count(self, name: str, amount=1):
+        """Add to one of the ResilienceStats counters"""
+        with self._lock:
+            setattr(self._stats, name, getattr(self._stats, name) + amount)
+
+    def hedge_delay(self, act: str) -> float:
+        """Seconds to wait for an answer before hedging: the act's recent p95"""
+        p95 = self.latency.p95(act)
+        return DEFAULT_HEDGE_DELAY if p95 is None else max(MIN_HEDGE_DELAY, p95)
+
+    def try_hedge(self) -> bool:
+        """Reserve a hedge if that keeps hedges within max_hedge_rate of requests"""
+        with self._lock:
+            if self._stats.hedges + 1 > self.max_hedge_rate * self._stats.requests:
+                return False
+            self._stats.hedges += 1
+            return True
+
+    def _bucket(self, act: str) -> Optional[TokenBucket]:
+        """The act's token bucket, or None if it is not rate limited"""
+        with self._lock:
+            if act not in self._buckets:
+                limit = self._rate_limits.get(act, self._default_rate)
+                self._buckets[act] = TokenBucket(*limit) if limit is not None else None
+            return self._buckets[act]
+
+    def call(self, act: str, send: Callable[[], T]) -> T:
+        """
+        Run one request with rate limiting, retries and the circuit breaker.
+
+        Args:
+            act: The API act, used to pick the rate limit
+            send: Performs a single attempt and returns its result
+
+        Returns:
+            The result of the first successful attempt
+        """
+        bucket = self._bucket(act)
+        for attempt in range(max(1, self.retry.attempts)):
+            try:
+                self.breaker.allow()
+            except CircuitOpenError:
+                self.count('short_circuits')
+                raise
+            if bucket is not None:
+                self.count('throttle_wait', bucket.acquire())
+            self.count('requests')
+            if attempt:
+                self.count('retries')
+
+            started = time.monotonic()
+            try:
+                result = send()
+            except Exception as e:
+                transient = is_transient(e)
+                # Only server trouble counts against the circuit, not bad input
+                self.breaker.record(not transient)
+                if not transient or attempt + 1 >= self.retry.attempts:
+                    self.count('failures')
+                    raise
+                time.sleep(self.retry.delay(attempt))
+                continue
+
+            self.breaker.record(True)
+            self.latency.record(act, time.monotonic() - started)
+            return result
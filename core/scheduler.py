@@ -0,0 +1,266 @@
+"""
+OASTH Polling Scheduler
+=======================
+Keeps many stops fresh under one global requests-per-minute budget.
+
+Every stop sits in a heap keyed by its next poll time. The interval for a
+stop starts from watch.poll_interval() (short while a bus is close, long
+for far-off or empty stops) and is shortened for stops whose estimates
+have been jumping around and for stops with a higher user priority.
+
+When the wanted poll rate exceeds the budget, every interval is stretched
+by the same factor, so the budget keeps the same split between imminent
+and idle stops instead of going first-come first-served. A token bucket
+enforces the budget as a hard limit on top of that.
+"""
+
+import heapq
+import threading
+import time
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional
+
+from .models import BusArrival
+from .watch import MIN_INTERVAL, poll_interval, project
+
+
+DEFAULT_BUDGET = 60      # Requests per minute across all stops
+DEFAULT_WORKERS = 4      # Requests in flight
+BURST_SECONDS = 5        # Token bucket holds this many seconds of budget
+DRIFT_WEIGHT = 0.3       # EWMA weight of the newest drift sample
+ERROR_INTERVAL = 60      # Seconds before retrying a stop that failed
+IMMINENT_MINUTES = 3     # Arrivals at or under this count as imminent
+
+
+@dataclass
+class StopState:
+    """What the scheduler knows about one stop"""
+    stop_code: str
+    priority: float = 1.0                  # Higher polls more often
+    arrivals: List[BusArrival] = field(default_factory=list)
+    drift: float = 0.0                     # Average minutes estimates moved between polls
+    next_poll: float = 0.0                 # Unix time the stop is due
+    polls: int = 0
+    errors: int = 0
+    last_error: Optional[BaseException] = None
+
+
+@dataclass
+class BudgetReport:
+    """How the scheduler is spending its budget"""
+    budget: float                          # Allowed requests per minute
+    used: int                              # Requests in the last minute
+    demand: float                          # Requests per minute the stops want
+    stretch: float                         # Factor intervals are stretched by (1 = unconstrained)
+    stops: int                             # Stops scheduled
+    overdue: int                           # Stops more than MIN_INTERVAL past due
+    by_kind: Dict[str, int]                # Last minute's requests: imminent/upcoming/empty/error
+
+
+def _kind(state: StopState) -> str:
+    """Budget category of a stop's last poll"""
+    if state.last_error is not None:
+        return 'error'
+    if not state.arrivals:
+        return 'empty'
+    if min(a.estimated_minutes for a in state.arrivals) <= IMMINENT_MINUTES:
+        return 'imminent'
+    return 'upcoming'
+
+
+def _drift(old: List[BusArrival], new: List[BusArrival], now: float) -> Optional[float]:
+    """
+    Mean minutes the new estimates moved from the old ones, both projected
+    to now (a board served from the cache may be older than the poll)
+    """
+    before = {(a.vehicle_code, a.route_code): a.minutes_at(now) for a in old if a.vehicle_code}
+    moves = []
+    for a in new:
+        key = (a.vehicle_code, a.route_code)
+        if key in before:
+            moves.append(abs(a.minutes_at(now) - before[key]))
+    return sum(moves) / len(moves) if moves else None
+
+
+class PollScheduler(threading.Thread):
+    """Background thread polling many stops within a request budget"""
+
+    def __init__(self, api=None, budget: float = DEFAULT_BUDGET,
+                 workers: int = DEFAULT_WORKERS,
+                 on_update: Optional[Callable[[StopState], None]] = None):
+        """
+        Initialize scheduler.
+
+        Args:
+            api: Optional OasthAPI to poll with. If None, a new one is created.
+            budget: Maximum requests per minute across all stops
+            workers: Maximum requests in flight
+            on_update: Called from a worker thread after every poll
+        """
+        super().__init__(name='oasth-poll-scheduler', daemon=True)
+        if api is None:
+            from .api import OasthAPI
+            api = OasthAPI()
+        self._api = api
+        self.budget = max(1.0, budget)
+        self._workers = max(1, workers)
+        self._on_update = on_update
+
+        self._states: Dict[str, StopState] = {}
+        self._heap = []                        # (next_poll, seq, stop_code)
+        self._seq = 0
+        self._in_flight = set()
+        self._wakeup = threading.Condition()
+        self._stop_event = threading.Event()
+
+        self._tokens = max(1.0, self.budget / 60 * BURST_SECONDS)
+        self._tokens_at = time.time()
+        self._spent = deque()                  # (time, kind) of recent requests
+        self._stretch = 1.0
+
+    # -- stops ----------------------------------------------------------
+
+    def add(self, stop_code: str, priority: float = 1.0):
+        """Start polling a stop (or change its priority). It is due at once."""
+        with self._wakeup:
+            state = self._states.get(stop_code)
+            if state is None:
+                state = self._states[stop_code] = StopState(stop_code, priority)
+                self._push(state, time.time())
+            state.priority = max(0.01, priority)
+            self._update_stretch()
+            self._wakeup.notify()
+
+    def remove(self, stop_code: str):
+        """Stop polling a stop"""
+        with self._wakeup:
+            self._states.pop(stop_code, None)  # Its heap entry is skipped when popped
+            self._update_stretch()
+
+    def arrivals(self, stop_code: str) -> List[BusArrival]:
+        """Latest arrivals for a stop, counted down to now"""
+        with self._wakeup:
+            state = self._states.get(stop_code)
+            arrivals = list(state.arrivals) if state else []
+        return project(arrivals)
+
+    def states(self) -> List[StopState]:
+        """Every scheduled stop, soonest due first"""
+        with self._wakeup:
+            return sorted(self._states.values(), key=lambda s: s.next_poll)
+
+    # -- budget ---------------------------------------------------------
+
+    def _base_interval(self, state: StopState) -> float:
+        """Interval the stop would get with an unlimited budget"""
+        if state.last_error is not None:
+            return ERROR_INTERVAL
+        return max(1.0, poll_interval(state.arrivals) / (state.priority * (1 + state.drift)))
+
+    def _update_stretch(self):
+        """Recompute how far intervals must stretch to fit the budget"""
+        demand = sum(60 / self._base_interval(s) for s in self._states.values())
+        self._stretch = max(1.0, demand / self.budget)
+
+    def _take_token(self, now: float) -> float:
+        """Spend a token if one is available; else return seconds until one is"""
+        rate = self.budget / 60
+        self._tokens = min(max(1.0, rate * BURST_SECONDS),
+                           self._tokens + (now - self._tokens_at) * rate)
+        self._tokens_at = now
+        if self._tokens >= 1:
+            self._tokens -= 1
+            return 0.0
+        return (1 - self._tokens) / rate
+
+    def report(self) -> BudgetReport:
+        """Snapshot of the budget and where it went over the last minute"""
+        now = time.time()
+        with self._wakeup:
+            while self._spent and self._spent[0][0] < now - 60:
+                self._spent.popleft()
+            demand = sum(60 / self._base_interval(s) for s in self._states.values())
+            return BudgetReport(
+                budget=self.budget,
+                used=len(self._spent),
+                demand=round(demand, 1),
+                stretch=round(self._stretch, 2),
+                stops=len(self._states),
+                overdue=sum(1 for s in self._states.values()
+                            if now - s.next_poll > MIN_INTERVAL),
+                by_kind=dict(Counter(kind for _, kind in self._spent)),
+            )
+
+    # -- loop -----------------------------------------------------------
+
+    def _push(self, state: StopState, when: float):
+        state.next_poll = when
+        self._seq += 1
+        heapq.heappush(self._heap, (when, self._seq, state.stop_code))
+
+    def stop(self):
+        """Ask the thread to exit"""
+        self._stop_event.set()
+        with self._wakeup:
+            self._wakeup.notify()
+
+    def run(self):
+        with ThreadPoolExecutor(max_workers=self._workers) as pool:
+            while not self._stop_event.is_set():
+                with self._wakeup:
+                    delay = self._next_due(pool)
+                    if delay != 0:
+                        self._wakeup.wait(delay)  # None: until a poll finishes or a stop is added
+
+    def _next_due(self, pool: ThreadPoolExecutor) -> Optional[float]:
+        """Dispatch the next due stop. Returns how long to sleep, 0 to go again."""
+        now = time.time()
+        while self._heap:
+            when, _, code = self._heap[0]
+            state = self._states.get(code)
+            if state is None or state.next_poll != when or code in self._in_flight:
+                heapq.heappop(self._heap)  # Removed, rescheduled or being polled
+                continue
+            if when > now:
+                return when - now
+            if len(self._in_flight) >= self._workers:
+                return None  # Woken when a poll finishes
+            wait = self._take_token(now)
+            if wait:
+                return wait
+            heapq.heappop(self._heap)
+            self._in_flight.add(code)
+            pool.submit(self._poll, state)
+            return 0.0
+        return None
+
+    def _poll(self, state: StopState):
+        try:
+            arrivals = self._api.get_arrivals(state.stop_code, 0)
+            error = None
+        except Exception as e:
+            arrivals, error = state.arrivals, e
+
+        now = time.time()
+        with self._wakeup:
+            if error is None:
+                drift = _drift(state.arrivals, arrivals, now)
+                if drift is not None:
+                    state.drift += DRIFT_WEIGHT * (drift - state.drift)
+                state.arrivals = arrivals
+            else:
+                state.errors += 1
+            state.last_error = error
+            state.polls += 1
+            self._spent.append((now, _kind(state)))
+            self._in_flight.discard(state.stop_code)
+
+            if state.stop_code in self._states:
+                self._update_stretch()
+                self._push(state, now + self._base_interval(state) * self._stretch)
+            self._wakeup.notify()
+
+        if self._on_update is not None:
+            self._on_update(state)
@@ -0,0 +1,322 @@
+"""
+OASTH Session Management
+========================
+Acquires the PHPSESSID cookie + window.token pair the API expects and
+caches it on disk for every process of the same user.
+
+Credentials normally come from a single GET of the landing page, which
+sets the cookie and embeds the token in an inline script. A headless
+browser is only launched when that extraction fails.
+
+Refreshes are single-flight: a thread lock serializes callers inside one
+process and an flock on session.lock serializes processes, so when a
+token expires exactly one bootstrap runs and everybody else reuses it.
+
+The server does not say how long a token lives, so every 401 records the
+age of the rejected session. Sessions are treated as expired at the
+median of the lifetimes seen in the last week, and long-running processes
+can run a SessionRenewer to refresh ahead of that point. Old observations
+expire, so the estimate recovers when the server starts keeping sessions
+longer.
+"""
+
+import fcntl
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass
+from typing import Callable, List, Optional, Tuple
+
+from .paths import CACHE_DIR, ensure_dir
+
+
+OASTH_URL = "https://telematics.oasth.gr/en/"
+SESSION_FILE = CACHE_DIR / 'session.json'
+LOCK_FILE = CACHE_DIR / 'session.lock'
+LIFETIMES_FILE = CACHE_DIR / 'session_lifetimes.json'
+SESSION_MAX_AGE = 60 * 60  # Seconds, same as the Android app
+MIN_LIFETIME = 60          # Ignore 401s on sessions younger than this
+LIFETIME_SAMPLES = 20      # Observed lifetimes to remember
+LIFETIME_WINDOW = 7 * 24 * 60 * 60  # Seconds an observed lifetime counts for
+RENEW_MARGIN = 0.8         # Renew at this fraction of the learned lifetime
+USER_AGENT = 'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36'
+
+# Ways the landing page has been seen to expose the token
+_TOKEN_PATTERNS = [
+    r"""window\.token\s*=\s*['"]([^'"]+)['"]""",
+    r"""\btoken\s*[:=]\s*['"]([0-9a-fA-F]{16,})['"]""",
+    r"""(?i)<meta\s+name=['"]csrf-token['"]\s+content=['"]([^'"]+)['"]""",
+]
+
+
+@dataclass
+class SessionData:
+    """Session credentials for API access"""
+    phpsessid: str        # PHPSESSID cookie
+    token: str            # window.token, sent as X-CSRF-Token
+    created_at: float     # Unix timestamp of acquisition
+
+    def age(self) -> float:
+        """Seconds since the session was acquired"""
+        return time.time() - self.created_at
+
+    def is_valid(self) -> bool:
+        """Check whether the session is still expected to work"""
+        return bool(self.phpsessid and self.token) and self.age() < learned_lifetime()
+
+
+# Serializes refreshes between threads; the flock handles other processes
+_refresh_lock = threading.Lock()
+
+# Observed (observed_at, lifetime) pairs, loaded on first use
+_lifetimes: Optional[List[Tuple[float, float]]] = None
+
+
+def _load_lifetimes() -> List[Tuple[float, float]]:
+    """Observed lifetimes that have not expired yet"""
+    global _lifetimes
+    if _lifetimes is None:
+        try:
+            with open(LIFETIMES_FILE, encoding='utf-8') as f:
+                # Bare numbers from older versions carry no date and are dropped
+                _lifetimes = [(float(x[0]), float(x[1])) for x in json.load(f)
+                              if isinstance(x, list) and len(x) == 2]
+        except (OSError, ValueError, TypeError):
+            _lifetimes = []
+    cutoff = time.time() - LIFETIME_WINDOW
+    if _lifetimes and _lifetimes[0][0] < cutoff:
+        _lifetimes = [s for s in _lifetimes if s[0] >= cutoff]
+    return _lifetimes
+
+
+def learned_lifetime() -> float:
+    """
+    Seconds a session is expected to stay valid.
+
+    Returns the median lifetime observed within LIFETIME_WINDOW (the lower
+    one for an even count), capped at SESSION_MAX_AGE. One early 401 does
+    not pin the estimate, and once the observations expire it goes back to
+    SESSION_MAX_AGE.
+    """
+    ages = sorted(age for _, age in _load_lifetimes())
+    if not ages:
+        return SESSION_MAX_AGE
+    return min(ages[(len(ages) - 1) // 2], SESSION_MAX_AGE)
+
+
+def record_expiry(session: SessionData):
+    """
+    Remember how old a session was when the server rejected it.
+
+    Args:
+        session: The session that just got a 401
+    """
+    global _lifetimes
+    age = session.age()
+    if age < MIN_LIFETIME:
+        return  # Rejected straight away, says nothing about its lifetime
+
+    samples = (_load_lifetimes() + [(time.time(), age)])[-LIFETIME_SAMPLES:]
+    _lifetimes = samples
+    try:
+        _write_json(LIFETIMES_FILE, [list(s) for s in samples])
+    except OSError:
+        pass
+
+
+@contextmanager
+def _file_lock():
+    """Exclusive inter-process lock around session refreshes"""
+    ensure_dir(LOCK_FILE.parent)
+    with open(LOCK_FILE, 'a') as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def _load_cached() -> Optional[SessionData]:
+    """Read the session file, if any"""
+    try:
+        with open(SESSION_FILE, encoding='utf-8') as f:
+            return SessionData(**json.load(f))
+    except (OSError, ValueError, TypeError):
+        return None
+
+
+def _write_json(path, data):
+    """Write a private JSON file atomically"""
+    import tempfile
+
+    ensure_dir(path.parent)
+    fd, tmp = tempfile.mkstemp(dir=path.parent, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(data, f)
+        os.chmod(tmp, 0o600)
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+def _save(session: SessionData):
+    """Write the session file atomically"""
+    _write_json(SESSION_FILE, asdict(session))
+
+
+def extract_token(html: str) -> Optional[str]:
+    """Find window.token in the landing page source"""
+    import re
+
+    for pattern in _TOKEN_PATTERNS:
+        match = re.search(pattern, html)
+        if match:
+            return match.group(1)
+    return None
+
+
+def _fetch_session_http() -> Optional[SessionData]:
+    """Bootstrap a session with one plain GET of the landing page"""
+    import requests
+
+    resp = requests.get(OASTH_URL, headers={'User-Agent': USER_AGENT}, timeout=10)
+    resp.raise_for_status()
+
+    token = extract_token(resp.text)
+    phpsessid = resp.cookies.get('PHPSESSID')
+    if not token or not phpsessid:
+        return None
+
+    return SessionData(phpsessid=phpsessid, token=token, created_at=time.time())
+
+
+def _fetch_session_browser() -> SessionData:
+    """Bootstrap a session with a headless browser"""
+    from playwright.sync_api import sync_playwright
+
+    with sync_playwright() as p:
+        browser = p.firefox.launch(headless=True, args=["--no-sandbox", "--disable-dev-shm-usage"])
+        try:
+            context = browser.new_context(service_workers="block")
+            page = context.new_page()
+            page.route("**/*.{png,jpg,jpeg,gif,svg,css,woff,woff2}", lambda route: route.abort())
+            page.goto(OASTH_URL, timeout=15000)
+            page.wait_for_function("() => window.token", timeout=10000)
+
+            token = page.evaluate("() => window.token")
+            cookies = context.cookies()
+            phpsessid = next((c['value'] for c in cookies if c['name'] == 'PHPSESSID'), None)
+        finally:
+            browser.close()
+
+    if not token or not phpsessid:
+        raise RuntimeError("Could not obtain OASTH session credentials")
+
+    return SessionData(phpsessid=phpsessid, token=token, created_at=time.time())
+
+
+def _fetch_session() -> SessionData:
+    """Acquire brand new session credentials"""
+    try:
+        session = _fetch_session_http()
+    except Exception:
+        session = None
+    if session is not None:
+        return session
+    return _fetch_session_browser()
+
+
+def get_session(force_refresh: bool = False, stale: Optional[SessionData] = None) -> SessionData:
+    """
+    Get valid session credentials, refreshing them if needed.
+
+    Only one refresh runs at a time across all threads and processes.
+    Callers that queue up behind a refresh reuse its result instead of
+    starting their own.
+
+    Args:
+        force_refresh: Ignore the cached session (e.g. after a 401)
+        stale: The session that was rejected, if known. Any cached session
+            other than this one is considered newer and reused.
+
+    Returns:
+        Session credentials
+    """
+    if not force_refresh:
+        cached = _load_cached()
+        if cached is not None and cached.is_valid():
+            return cached
+
+    requested_at = time.time()
+
+    with _refresh_lock, _file_lock():
+        cached = _load_cached()
+        if cached is not None and cached.is_valid():
+            if not force_refresh:
+                return cached
+            # Somebody else refreshed while we were waiting for the lock
+            if cached.created_at >= requested_at:
+                return cached
+            if stale is not None and cached.token != stale.token:
+                return cached
+
+        session = _fetch_session()
+        _save(session)
+        return session
+
+
+def clear_session_cache():
+    """Delete the cached session"""
+    try:
+        SESSION_FILE.unlink()
+    except FileNotFoundError:
+        pass
+
+
+class SessionRenewer(threading.Thread):
+    """Background thread that refreshes the session before it expires"""
+
+    RETRY_DELAY = 60  # Seconds to wait after a failed refresh
+
+    def __init__(self, on_renew: Optional[Callable[[SessionData], None]] = None):
+        """
+        Initialize renewer.
+
+        Args:
+            on_renew: Called with every new session, e.g. to hand it to a client
+        """
+        super().__init__(name='oasth-session-renewer', daemon=True)
+        self._on_renew = on_renew
+        self._stop_event = threading.Event()
+
+    def stop(self):
+        """Ask the thread to exit"""
+        self._stop_event.set()
+
+    def run(self):
+        session = None
+        while not self._stop_event.is_set():
+            try:
+                if session is None:
+                    session = get_session()
+                    self._notify(session)
+
+                renew_at = session.created_at + learned_lifetime() * RENEW_MARGIN
+                if self._stop_event.wait(max(0, renew_at - time.time())):
+                    break
+
+                # A reused session that is still young means another process
+                # renewed already; the loop just waits for the next deadline.
+                session = get_session(force_refresh=True, stale=session)
+                self._notify(session)
+            except Exception:
+                session = None
+                self._stop_event.wait(self.RETRY_DELAY)
+
+    def _notify(self, session: SessionData):
+        if self._on_renew is not None:
+            self._on_renew(session)
@@ -0,0 +1,250 @@
+"""
+OASTH Stop Index
+================
+Searchable index over the bundled stops.json (Street ID -> name, API IDs).
+
+The JSON is compiled once into an SQLite file in the cache directory and
+rebuilt only when stops.json changes, so queries never parse it. Names
+are folded to a Latin search key (accents, case and final sigma removed,
+Greek transliterated), which lets "ΒΟΣΠ", "βοσπ" and "vosp" all find
+ΒΟΣΠΟΡΟΣ. Queries match name prefixes, word prefixes and, for longer
+input, any substring through a trigram table.
+"""
+
+import json
+import re
+import sqlite3
+import unicodedata
+from pathlib import Path
+from typing import List, Optional
+
+from .models import StreetStop
+from .paths import ASSETS_DIR, CACHE_DIR, ensure_dir
+
+
+STOPS_FILE = ASSETS_DIR / 'stops.json'
+INDEX_FILE = CACHE_DIR / 'stops.sqlite'
+INDEX_VERSION = '2'
+
+_GREEK_TO_LATIN = {
+    'α': 'a', 'β': 'v', 'γ': 'g', 'δ': 'd', 'ε': 'e', 'ζ': 'z', 'η': 'i',
+    'θ': 'th', 'ι': 'i', 'κ': 'k', 'λ': 'l', 'μ': 'm', 'ν': 'n', 'ξ': 'x',
+    'ο': 'o', 'π': 'p', 'ρ': 'r', 'σ': 's', 'ς': 's', 'τ': 't', 'υ': 'y',
+    'φ': 'f', 'χ': 'ch', 'ψ': 'ps', 'ω': 'o',
+}
+
+# Vowel pairs with a fixed Latin spelling, applied before single letters
+_GREEK_DIGRAPHS = [('ου', 'ou'), ('αυ', 'av'), ('ευ', 'ev')]
+
+# Latin spellings of the same Greek sound (υ typed as "i", ω as "w")
+_LATIN_FOLD = str.maketrans({'y': 'i', 'w': 'o'})
+
+# αυ/ευ sound "af"/"ef" before a voiceless consonant (κ π τ χ φ θ σ ξ ψ);
+# both spellings fold to the f form, so "efkarp" and "evkarp" match alike
+_VOICELESS_DIGRAPH = re.compile(r'([ae])v(?=[kptcfsx])')
+
+
+def search_key(text: str) -> str:
+    """
+    Fold a stop name or query to its search form.
+
+    Strips accents, case and punctuation, transliterates Greek to Latin and
+    collapses whitespace, e.g. "Κ.Τ.Ε.Λ. Ευκαρπίας" -> "ktel efkarpias".
+    """
+    decomposed = unicodedata.normalize('NFD', text.casefold())
+    bare = ''.join(ch for ch in decomposed if not unicodedata.combining(ch))
+    for greek, latin in _GREEK_DIGRAPHS:
+        bare = bare.replace(greek, latin)
+    out = []
+    for ch in bare:
+        if ch in _GREEK_TO_LATIN:
+            out.append(_GREEK_TO_LATIN[ch])
+        elif ch.isalnum():
+            out.append(ch)
+        elif ch in '.΄\'':
+            continue  # Abbreviation dots and tonos join the letters around them
+        else:
+            out.append(' ')
+    latin = _VOICELESS_DIGRAPH.sub(r'\1f', ''.join(out).translate(_LATIN_FOLD))
+    return ' '.join(latin.split())
+
+
+def _trigrams(key: str) -> set:
+    return {key[i:i + 3] for i in range(len(key) - 2)}
+
+
+def _source_stamp(path: Path) -> str:
+    stat = path.stat()
+    return f"{INDEX_VERSION}:{stat.st_size}:{stat.st_mtime_ns}"
+
+
+class StopIndex:
+    """SQLite-backed search over every stop in stops.json"""
+
+    def __init__(self, index_file: Path = INDEX_FILE, source: Path = STOPS_FILE):
+        """
+        Open the index, building it first if stops.json changed.
+
+        Args:
+            index_file: Where the compiled index lives
+            source: The stops.json to index
+        """
+        self.index_file = Path(index_file)
+        self.source = Path(source)
+        self._db = self._open()
+
+    def _open(self) -> sqlite3.Connection:
+        stamp = _source_stamp(self.source)
+        if self.index_file.exists():
+            db = sqlite3.connect(self.index_file, check_same_thread=False)
+            try:
+                row = db.execute("SELECT value FROM meta WHERE key = 'source'").fetchone()
+                if row and row[0] == stamp:
+                    return db
+            except sqlite3.DatabaseError:
+                pass
+            db.close()
+        return self._build(stamp)
+
+    def _build(self, stamp: str) -> sqlite3.Connection:
+        """Compile stops.json into a fresh index file"""
+        with open(self.source, encoding='utf-8') as f:
+            stops = [StreetStop.from_asset(v) for v in json.load(f).values()]
+
+        ensure_dir(self.index_file.parent)
+        tmp = self.index_file.with_suffix('.tmp')
+        tmp.unlink(missing_ok=True)
+        db = sqlite3.connect(tmp)
+        db.executescript("""
+            CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT);
+            CREATE TABLE stops (
+                street_id TEXT PRIMARY KEY,
+                stop_descr TEXT NOT NULL,
+                api_ids TEXT NOT NULL,
+                skey TEXT NOT NULL
+            );
+            CREATE TABLE words (word TEXT NOT NULL, street_id TEXT NOT NULL);
+            CREATE TABLE trigrams (tri TEXT NOT NULL, street_id TEXT NOT NULL);
+        """)
+        for stop in stops:
+            key = search_key(stop.stop_descr)
+            db.execute("INSERT OR REPLACE INTO stops VALUES (?, ?, ?, ?)",
+                       (stop.street_id, stop.stop_descr, ','.join(stop.api_ids), key))
+            db.executemany("INSERT INTO words VALUES (?, ?)",
+                           [(w, stop.street_id) for w in set(key.split())])
+            db.executemany("INSERT INTO trigrams VALUES (?, ?)",
+                           [(t, stop.street_id) for t in _trigrams(key)])
+        db.executescript("""
+            CREATE INDEX stops_skey ON stops (skey);
+            CREATE INDEX words_word ON words (word, street_id);
+            CREATE INDEX trigrams_tri ON trigrams (tri, street_id);
+        """)
+        db.execute("INSERT INTO meta VALUES ('source', ?)", (stamp,))
+        db.commit()
+        db.close()
+        tmp.replace(self.index_file)
+        return sqlite3.connect(self.index_file, check_same_thread=False)
+
+    def close(self):
+        self._db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _rows(self, sql: str, args: tuple) -> List[StreetStop]:
+        return [
+            StreetStop(street_id=row[0], stop_descr=row[1],
+                       api_ids=row[2].split(',') if row[2] else [])
+            for row in self._db.execute(sql, args)
+        ]
+
+    def get(self, street_id: str) -> Optional[StreetStop]:
+        """Look up one stop by its Street ID"""
+        rows = self._rows(
+            "SELECT street_id, stop_descr, api_ids FROM stops WHERE street_id = ?",
+            (street_id,))
+        return rows[0] if rows else None
+
+    def search(self, query: str, limit: int = 10) -> List[StreetStop]:
+        """
+        Find stops by name or Street ID.
+
+        Results are ranked: whole-name prefix first, then stops where every
+        query word prefixes some word of the name, then substring matches.
+
+        Args:
+            query: Greek or Latin text, any case and accents, or a Street ID
+            limit: Maximum number of results
+
+        Returns:
+            Matching stops, best first
+        """
+        key = search_key(query)
+        if not key:
+            return []
+
+        cols = "s.street_id, s.stop_descr, s.api_ids"
+        results = {}
+
+        def add(stops: List[StreetStop]):
+            for stop in stops:
+                if len(results) >= limit:
+                    return
+                results.setdefault(stop.street_id, stop)
+
+        if key.isdigit():
+            add(self._rows(
+                f"SELECT {cols} FROM stops s WHERE s.street_id >= ? AND s.street_id < ? "
+                "ORDER BY length(s.street_id), s.street_id LIMIT ?",
+                (key, key + '\uffff', limit)))
+
+        # Name starts with the query
+        add(self._rows(
+            f"SELECT {cols} FROM stops s WHERE s.skey >= ? AND s.skey < ? "
+            "ORDER BY s.skey LIMIT ?",
+            (key, key + '\uffff', limit)))
+
+        # Every query word starts some word of the name
+        words = key.split()
+        if len(results) < limit:
+            clauses = " AND ".join(
+                "EXISTS (SELECT 1 FROM words w WHERE w.street_id = s.street_id "
+                "AND w.word >= ? AND w.word < ?)" for _ in words)
+            args = [a for w in words for a in (w, w + '\uffff')]
+            first = words[0]
+            add(self._rows(
+                f"SELECT {cols} FROM stops s WHERE s.street_id IN "
+                "(SELECT street_id FROM words WHERE word >= ? AND word < ?) "
+                f"AND {clauses} ORDER BY s.skey LIMIT ?",
+                (first, first + '\uffff', *args, limit)))
+
+        # Substring anywhere in the name
+        tris = sorted(_trigrams(key))
+        if len(results) < limit and tris:
+            marks = ",".join("?" * len(tris))
+            candidates = self._rows(
+                f"SELECT {cols} FROM stops s WHERE s.street_id IN ("
+                f"SELECT street_id FROM trigrams WHERE tri IN ({marks}) "
+                f"GROUP BY street_id HAVING count(*) = ?) ORDER BY s.skey",
+                (*tris, len(tris)))
+            add([c for c in candidates if key in search_key(c.stop_descr)])
+
+        return list(results.values())
+
+
+def search_stops(query: str, limit: int = 10) -> List[StreetStop]:
+    """
+    Quick function to search the bundled stops.
+
+    Args:
+        query: Stop name (Greek or Latin) or Street ID
+        limit: Maximum number of results
+
+    Returns:
+        Matching stops, best first
+    """
+    with StopIndex() as index:
+        return index.search(query, limit)
@@ -0,0 +1,296 @@
+"""
+OASTH Network Topology
+======================
+Crawls lines -> routes -> stops and regenerates the bundled assets
+(lines.json, routes.json, stops.json) from it.
+
+The graph is kept in the cache directory between runs. Every run fetches
+the line catalogue and each line's routes, but a route's stops are only
+fetched again when the route's own record (description, type, distance)
+hashes differently from last time, so a refresh costs about one request
+per line instead of one per route. Routes that fail, including ones the
+server answers with null instead of a list, keep their previous stops and
+are retried on the next run.
+
+Assets are written minified, and only when their content changed.
+"""
+
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from .paths import ASSETS_DIR, CACHE_DIR, ensure_dir
+
+
+GRAPH_FILE = CACHE_DIR / 'topology.json'
+GRAPH_VERSION = 1
+DEFAULT_WORKERS = 8
+
+
+def _field(record: dict, *names: str) -> str:
+    """First present field of a record, as a string"""
+    for name in names:
+        value = record.get(name)
+        if value is not None:
+            return str(value)
+    return ''
+
+
+def _digest(record: dict) -> str:
+    data = json.dumps(record, ensure_ascii=False, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(data.encode('utf-8')).hexdigest()
+
+
+def _write_atomic(path: Path, data: bytes):
+    import tempfile
+
+    ensure_dir(path.parent)
+    fd, tmp = tempfile.mkstemp(dir=path.parent, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+@dataclass
+class CrawlReport:
+    """What a crawl did"""
+    lines: int = 0
+    routes: int = 0
+    stops: int = 0
+    routes_fetched: int = 0       # Routes whose stops were (re-)fetched
+    routes_unchanged: int = 0     # Routes skipped because their hash matched
+    failures: List[str] = field(default_factory=list)
+    assets_written: List[str] = field(default_factory=list)
+    elapsed: float = 0.0
+
+
+class Topology:
+    """
+    The line/route/stop graph.
+
+    Attributes:
+        lines: line_code -> {'line_id', 'line_descr', 'routes': [route_code]}
+        routes: route_code -> {'line_code', 'route_descr', 'hash', 'stops': [stop_code]}
+        stops: stop_code -> {'street_id', 'stop_descr', 'lat', 'lng'}
+    """
+
+    def __init__(self, lines: Optional[Dict[str, dict]] = None,
+                 routes: Optional[Dict[str, dict]] = None,
+                 stops: Optional[Dict[str, dict]] = None,
+                 updated_at: float = 0.0):
+        self.lines = lines or {}
+        self.routes = routes or {}
+        self.stops = stops or {}
+        self.updated_at = updated_at
+
+    @classmethod
+    def load(cls, path: Path = GRAPH_FILE) -> 'Topology':
+        """Read a saved graph; an empty one if absent or of another version"""
+        try:
+            with open(path, encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return cls()
+        if data.get('version') != GRAPH_VERSION:
+            return cls()
+        return cls(data['lines'], data['routes'], data['stops'], data['updated_at'])
+
+    def save(self, path: Path = GRAPH_FILE):
+        """Write the graph atomically"""
+        data = {'version': GRAPH_VERSION, 'updated_at': self.updated_at,
+                'lines': self.lines, 'routes': self.routes, 'stops': self.stops}
+        _write_atomic(Path(path), json.dumps(data, ensure_ascii=False,
+                                             separators=(',', ':')).encode('utf-8'))
+
+    def assets(self) -> Dict[str, object]:
+        """Contents of lines.json, routes.json and stops.json, in the bundled format"""
+        lines = {l['line_id']: l['line_descr'] for l in self.lines.values() if l['line_id']}
+        routes = {code: r['route_descr'] for code, r in self.routes.items()}
+
+        stops = {}
+        for code, s in self.stops.items():
+            street_id = s['street_id'] or code
+            entry = stops.setdefault(street_id, {'StreetID': street_id,
+                                                 'StopDescr': s['stop_descr'], 'API_IDs': []})
+            entry['API_IDs'].append(code)
+        for entry in stops.values():
+            entry['API_IDs'].sort(key=lambda c: (len(c), c))
+        return {'lines.json': lines, 'routes.json': routes, 'stops.json': stops}
+
+    def write_assets(self, directory: Path = ASSETS_DIR) -> List[str]:
+        """
+        Write the asset files that changed.
+
+        Returns:
+            Names of the files written
+        """
+        written = []
+        for name, content in self.assets().items():
+            data = json.dumps(content, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+            path = Path(directory) / name
+            try:
+                if path.read_bytes() == data:
+                    continue
+            except OSError:
+                pass
+            _write_atomic(path, data)
+            written.append(name)
+        return written
+
+    def bus_stops(self) -> list:
+        """Stops as BusStop objects, e.g. for StopGeoIndex.build()"""
+        from .models import BusStop
+
+        return [BusStop(code, s['stop_descr'], s['lat'], s['lng'])
+                for code, s in self.stops.items()]
+
+
+def crawl(api, topology: Optional[Topology] = None, workers: int = DEFAULT_WORKERS,
+          full: bool = False) -> CrawlReport:
+    """
+    Refresh a topology from the API, in place.
+
+    Args:
+        api: An OasthAPI, preferably without a metadata cache: a cached
+            answer served in place of a failed request would be taken
+            for the current one
+        topology: Graph from an earlier run (empty if None)
+        workers: Requests in flight
+        full: Re-fetch the stops of every route, changed or not
+
+    Returns:
+        What was fetched, skipped and failed
+    """
+    started = time.monotonic()
+    topology = topology if topology is not None else Topology()
+    report = CrawlReport()
+    api.set_pool_size(workers)
+
+    line_records = api.get_catalogue('webGetLines', strict=True)
+    if not line_records:
+        raise RuntimeError("webGetLines returned no lines")
+    line_codes = [_field(r, 'LineCode', 'line_code') for r in line_records]
+
+    def routes_of(line_code: str):
+        return api.get_catalogue('webGetRoutesForLine', {'p1': line_code}, strict=True)
+
+    def stops_of(route_code: str):
+        return api.get_catalogue('webGetStopsForRoute', {'p1': route_code}, strict=True)
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        route_futures = {code: pool.submit(routes_of, code) for code in line_codes}
+
+        lines, routes, stale = {}, {}, []
+        for record, line_code in zip(line_records, line_codes):
+            try:
+                route_records = route_futures[line_code].result()
+            except Exception as e:
+                # Keep what the last run knew about this line
+                report.failures.append(f"routes of line {line_code}: {e}")
+                old = topology.lines.get(line_code)
+                if old is not None:
+                    lines[line_code] = old
+                    routes.update({c: topology.routes[c] for c in old['routes']
+                                   if c in topology.routes})
+                continue
+
+            codes = []
+            for r in route_records:
+                route_code = _field(r, 'RouteCode', 'route_code')
+                digest = _digest(r)
+                old = topology.routes.get(route_code)
+                routes[route_code] = {
+                    'line_code': line_code,
+                    'route_descr': _field(r, 'RouteDescr', 'route_descr'),
+                    'hash': digest,
+                    'stops': old['stops'] if old else [],
+                }
+                if full or old is None or old['hash'] != digest:
+                    stale.append(route_code)
+                codes.append(route_code)
+            lines[line_code] = {
+                'line_id': _field(record, 'LineID', 'line_id'),
+                'line_descr': _field(record, 'LineDescr', 'line_descr'),
+                'routes': codes,
+            }
+
+        report.routes_unchanged = len(routes) - len(stale)
+        stop_futures = {code: pool.submit(stops_of, code) for code in stale}
+        fetched = {}
+        for route_code, future in stop_futures.items():
+            try:
+                stop_records = future.result()
+            except Exception as e:
+                report.failures.append(f"stops of route {route_code}: {e}")
+                old = topology.routes.get(route_code)
+                # Fetch it again next time
+                routes[route_code]['hash'] = old['hash'] if old else ''
+                continue
+            report.routes_fetched += 1
+            route_stops = []
+            for s in stop_records:
+                code = _field(s, 'StopCode', 'stop_code')
+                fetched[code] = {
+                    'street_id': _field(s, 'StopID', 'stop_id'),
+                    'stop_descr': _field(s, 'StopDescr', 'stop_descr'),
+                    'lat': float(s.get('StopLat', s.get('stop_lat')) or 0),
+                    'lng': float(s.get('StopLng', s.get('stop_lng')) or 0),
+                }
+                route_stops.append(code)
+            routes[route_code]['stops'] = route_stops
+
+    # Stops of unchanged routes carry over; stops no route serves are dropped.
+    # Route order keeps the assets byte-identical when nothing changed.
+    stops = {}
+    for route in routes.values():
+        for code in route['stops']:
+            stop = fetched.get(code) or topology.stops.get(code)
+            if stop is not None:
+                stops.setdefault(code, stop)
+
+    topology.lines, topology.routes, topology.stops = lines, routes, stops
+    topology.updated_at = time.time()
+    report.lines, report.routes, report.stops = len(lines), len(routes), len(stops)
+    report.elapsed = time.monotonic() - started
+    return report
+
+
+def refresh_topology(api=None, path: Path = GRAPH_FILE, assets_dir: Optional[Path] = ASSETS_DIR,
+                     workers: int = DEFAULT_WORKERS, full: bool = False) -> CrawlReport:
+    """
+    Crawl incrementally from the saved graph, then save the graph, the
+    assets and the stop location index.
+
+    Args:
+        api: OasthAPI to use. If None, one without caches is created.
+        path: Saved graph
+        assets_dir: Where to write lines.json, routes.json and stops.json
+            (None to skip)
+        workers: Requests in flight
+        full: Re-fetch every route's stops
+
+    Returns:
+        What the crawl did
+    """
+    if api is None:
+        from .api import OasthAPI
+        api = OasthAPI(pool_size=workers)
+
+    topology = Topology.load(path)
+    report = crawl(api, topology, workers, full)
+    topology.save(path)
+    if assets_dir is not None:
+        report.assets_written = topology.write_assets(assets_dir)
+    if report.routes_fetched:
+        from .geo import StopGeoIndex
+        StopGeoIndex.build(topology.bus_stops()).save()
+    return report
@@ -0,0 +1,404 @@
+"""
+OASTH HTTP Transports
+=====================
+The one HTTP call OasthAPI makes, behind a small interface.
+
+- RequestsTransport: requests.Session with a sized connection pool (default)
+- HttpxTransport: httpx.Client with HTTP/2 and keep-alive (optional
+  dependency: `pip install httpx[http2]`)
+- FakeTransport: answers from recorded responses in memory, for tests and
+  for benchmarking parsing and caching without a network
+- RecordingTransport: wraps another transport and saves what it sees in
+  the format FakeTransport loads
+
+Every backend raises the errors defined here, so retry logic does not
+depend on which HTTP library is in use. Transport.stream() returns before
+the body is read, for catalogue responses that are parsed as they arrive.
+"""
+
+import json
+import threading
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, Iterator, Optional, Union
+from urllib.parse import parse_qsl, urlsplit
+
+
+DEFAULT_POOL_SIZE = 10  # Pooled connections kept per host
+CHUNK_SIZE = 16 * 1024  # Bytes per chunk of a streamed body
+
+
+class TransportError(Exception):
+    """The request did not get an HTTP response"""
+
+
+class TransportTimeout(TransportError):
+    """The server did not answer in time"""
+
+
+class HTTPStatusError(TransportError):
+    """The server answered with a 4xx or 5xx status"""
+
+    def __init__(self, status_code: int, url: str = ''):
+        super().__init__(f"HTTP {status_code} for {url}")
+        self.status_code = status_code
+
+
+class Response:
+    """Status and body of an HTTP response"""
+
+    __slots__ = ('status_code', 'content', 'url')
+
+    def __init__(self, status_code: int, content: bytes, url: str = ''):
+        self.status_code = status_code
+        self.content = content
+        self.url = url
+
+    def json(self) -> Any:
+        return json.loads(self.content)
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise HTTPStatusError(self.status_code, self.url)
+
+
+class StreamedResponse:
+    """
+    Status of an HTTP response whose body is read chunk by chunk.
+
+    Iterate it for the body; close it (or use it as a context manager) to
+    release the connection, whether or not the body was read to the end.
+    """
+
+    def __init__(self, status_code: int, chunks: Iterable[bytes], url: str = '',
+                 close: Optional[Callable[[], None]] = None):
+        self.status_code = status_code
+        self.url = url
+        self._chunks = chunks
+        self._close = close
+
+    def __iter__(self) -> Iterator[bytes]:
+        return iter(self._chunks)
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            self.close()
+            raise HTTPStatusError(self.status_code, self.url)
+
+    def close(self):
+        if self._close is not None:
+            self._close()
+            self._close = None
+
+    def __enter__(self) -> 'StreamedResponse':
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class Transport:
+    """Sends one HTTP request. Implementations must be thread-safe."""
+
+    def request(self, method: str, url: str, headers: Dict[str, str],
+                timeout: float) -> Response:
+        """
+        Send a request.
+
+        Args:
+            method: 'GET' or 'POST'
+            url: Full URL including the query string
+            headers: Request headers, cookies included
+            timeout: Seconds to wait for the response
+
+        Returns:
+            The response, whatever its status
+
+        Raises:
+            TransportTimeout, TransportError
+        """
+        raise NotImplementedError
+
+    def stream(self, method: str, url: str, headers: Dict[str, str],
+               timeout: float) -> StreamedResponse:
+        """
+        Send a request and return before the body has been read.
+
+        Backends without streaming support read the whole body and hand it
+        out in chunks.
+
+        Returns:
+            The response, whatever its status. Errors while reading the
+            body raise TransportError from the iteration.
+        """
+        resp = self.request(method, url, headers, timeout)
+        content = resp.content
+        chunks = (content[i:i + CHUNK_SIZE] for i in range(0, len(content), CHUNK_SIZE))
+        return StreamedResponse(resp.status_code, chunks, url)
+
+    def set_pool_size(self, pool_size: int):
+        """Resize the connection pool, if the backend has one"""
+
+    def close(self):
+        """Release pooled connections"""
+
+
+class RequestsTransport(Transport):
+    """requests.Session backend"""
+
+    def __init__(self, pool_size: int = DEFAULT_POOL_SIZE):
+        self._pool_size = pool_size
+        self._session = None
+        self._lock = threading.Lock()
+
+    @property
+    def _http(self):
+        """requests.Session, created on first request"""
+        if self._session is None:
+            with self._lock:
+                if self._session is None:
+                    import requests
+                    session = requests.Session()
+                    self._mount(session)
+                    self._session = session
+        return self._session
+
+    def _mount(self, session):
+        from requests.adapters import HTTPAdapter
+
+        for prefix in ('https://', 'http://'):
+            session.mount(prefix, HTTPAdapter(pool_connections=1, pool_maxsize=self._pool_size))
+
+    def set_pool_size(self, pool_size: int):
+        with self._lock:
+            self._pool_size = pool_size
+            if self._session is not None:
+                self._mount(self._session)
+
+    def request(self, method: str, url: str, headers: Dict[str, str],
+                timeout: float) -> Response:
+        import requests
+
+        try:
+            resp = self._http.request(method, url, headers=headers, timeout=timeout)
+        except requests.Timeout as e:
+            raise TransportTimeout(str(e)) from e
+        except requests.RequestException as e:
+            raise TransportError(str(e)) from e
+        return Response(resp.status_code, resp.content, url)
+
+    def stream(self, method: str, url: str, headers: Dict[str, str],
+               timeout: float) -> StreamedResponse:
+        import requests
+
+        try:
+            resp = self._http.request(method, url, headers=headers, timeout=timeout, stream=True)
+        except requests.Timeout as e:
+            raise TransportTimeout(str(e)) from e
+        except requests.RequestException as e:
+            raise TransportError(str(e)) from e
+
+        def chunks() -> Iterator[bytes]:
+            try:
+                yield from resp.iter_content(CHUNK_SIZE)
+            except requests.Timeout as e:
+                raise TransportTimeout(str(e)) from e
+            except requests.RequestException as e:
+                raise TransportError(str(e)) from e
+
+        return StreamedResponse(resp.status_code, chunks(), url, resp.close)
+
+    def close(self):
+        if self._session is not None:
+            self._session.close()
+
+
+class HttpxTransport(Transport):
+    """httpx.Client backend with HTTP/2 when the h2 package is installed"""
+
+    def __init__(self, pool_size: int = DEFAULT_POOL_SIZE, http2: bool = True):
+        """
+        Initialize transport.
+
+        Args:
+            pool_size: Connections kept alive
+            http2: Negotiate HTTP/2, multiplexing requests over one connection.
+                Falls back to HTTP/1.1 if h2 is not installed.
+        """
+        try:
+            import httpx
+        except ImportError:
+            raise ImportError("HttpxTransport needs httpx: pip install 'httpx[http2]'") from None
+
+        self._httpx = httpx
+        self._http2 = http2
+        self._lock = threading.Lock()
+        self._client = self._make_client(pool_size)
+        self._in_use: Dict[Any, int] = {}  # Client -> requests running on it
+
+    def _make_client(self, pool_size: int):
+        limits = self._httpx.Limits(max_connections=pool_size,
+                                    max_keepalive_connections=pool_size)
+        try:
+            return self._httpx.Client(http2=self._http2, limits=limits)
+        except ImportError:  # h2 missing
+            self._http2 = False
+            return self._httpx.Client(limits=limits)
+
+    @property
+    def http2(self) -> bool:
+        """Whether HTTP/2 is enabled"""
+        return self._http2
+
+    def set_pool_size(self, pool_size: int):
+        # Requests still running on the old client keep it open; the last
+        # one to finish closes it (see _release)
+        with self._lock:
+            old, self._client = self._client, self._make_client(pool_size)
+            idle = old not in self._in_use
+        if idle:
+            old.close()
+
+    def _acquire(self):
+        """The current client, counted as in use until _release()"""
+        with self._lock:
+            client = self._client
+            self._in_use[client] = self._in_use.get(client, 0) + 1
+            return client
+
+    def _release(self, client):
+        with self._lock:
+            left = self._in_use[client] - 1
+            if left:
+                self._in_use[client] = left
+                return
+            del self._in_use[client]
+            replaced = client is not self._client
+        if replaced:
+            client.close()
+
+    def request(self, method: str, url: str, headers: Dict[str, str],
+                timeout: float) -> Response:
+        httpx = self._httpx
+        client = self._acquire()
+        try:
+            resp = client.request(method, url, headers=headers, timeout=timeout)
+        except httpx.TimeoutException as e:
+            raise TransportTimeout(str(e)) from e
+        except httpx.HTTPError as e:
+            raise TransportError(str(e)) from e
+        finally:
+            self._release(client)
+        return Response(resp.status_code, resp.content, url)
+
+    def stream(self, method: str, url: str, headers: Dict[str, str],
+               timeout: float) -> StreamedResponse:
+        httpx = self._httpx
+        client = self._acquire()
+        try:
+            try:
+                resp = client.send(client.build_request(method, url, headers=headers,
+                                                        timeout=timeout), stream=True)
+            except httpx.TimeoutException as e:
+                raise TransportTimeout(str(e)) from e
+            except httpx.HTTPError as e:
+                raise TransportError(str(e)) from e
+        except BaseException:
+            self._release(client)
+            raise
+
+        def chunks() -> Iterator[bytes]:
+            try:
+                yield from resp.iter_bytes(CHUNK_SIZE)
+            except httpx.TimeoutException as e:
+                raise TransportTimeout(str(e)) from e
+            except httpx.HTTPError as e:
+                raise TransportError(str(e)) from e
+
+        def close():
+            try:
+                resp.close()
+            finally:
+                self._release(client)
+
+        return StreamedResponse(resp.status_code, chunks(), url, close)
+
+    def close(self):
+        self._client.close()
+
+
+def _route(url: str) -> str:
+    """Recording key for a URL: the query string with parameters sorted"""
+    return '&'.join(f"{k}={v}" for k, v in sorted(parse_qsl(urlsplit(url).query)))
+
+
+class FakeTransport(Transport):
+    """Answers from recorded responses without touching the network"""
+
+    def __init__(self, responses: Optional[Dict[str, Any]] = None,
+                 handler: Optional[Callable[[str, str, Dict[str, str]], Response]] = None,
+                 latency: float = 0.0):
+        """
+        Initialize transport.
+
+        Args:
+            responses: Decoded JSON bodies keyed by sorted query string,
+                e.g. {"act=getStopArrivals&p1=3344": [...]}
+            handler: Called as handler(method, url, headers) for requests
+                with no recorded response
+            latency: Seconds to sleep per request, to simulate the network
+        """
+        self._responses = {key: json.dumps(body).encode() for key, body in (responses or {}).items()}
+        self._handler = handler
+        self.latency = latency
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, path: Union[str, Path], **kwargs) -> 'FakeTransport':
+        """Create from a file written by RecordingTransport.save()"""
+        with open(path, encoding='utf-8') as f:
+            return cls(json.load(f), **kwargs)
+
+    def request(self, method: str, url: str, headers: Dict[str, str],
+                timeout: float) -> Response:
+        with self._lock:
+            self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        body = self._responses.get(_route(url))
+        if body is not None:
+            return Response(200, body, url)
+        if self._handler is not None:
+            return self._handler(method, url, headers)
+        return Response(404, b'null', url)
+
+
+class RecordingTransport(Transport):
+    """Passes requests through and keeps their successful responses"""
+
+    def __init__(self, inner: Transport):
+        self._inner = inner
+        self._recorded: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+
+    def request(self, method: str, url: str, headers: Dict[str, str],
+                timeout: float) -> Response:
+        resp = self._inner.request(method, url, headers, timeout)
+        if resp.status_code == 200:
+            with self._lock:
+                self._recorded[_route(url)] = resp.json()
+        return resp
+
+    def set_pool_size(self, pool_size: int):
+        self._inner.set_pool_size(pool_size)
+
+    def save(self, path: Union[str, Path]):
+        """Write the recorded responses for FakeTransport.load()"""
+        with self._lock:
+            recorded = dict(self._recorded)
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(recorded, f, ensure_ascii=False, indent=1)
+
+    def close(self):
+        self._inner.close()
@@ -0,0 +1,60 @@
+"""
+OASTH Watch Helpers
+===================
+Polling policy and local countdown for long-running displays.
+
+A display polls the API only every poll_interval() seconds and counts the
+minutes down itself in between (project()), so it stays accurate with far
+fewer upstream requests than a fixed-rate `watch -n 30`. Past the
+confidence horizon a projection is no longer trusted and the stop is
+fetched again.
+"""
+
+import time
+from typing import List, Optional
+
+from .models import BusArrival
+
+
+MIN_INTERVAL = 20       # Seconds between polls when a bus is about to arrive
+MAX_INTERVAL = 180      # Seconds between polls when nothing is close
+EMPTY_INTERVAL = 120    # Seconds between polls for a stop with no buses
+INTERVAL_PER_MINUTE = 15  # Poll interval grows by this per minute of the nearest ETA
+DEFAULT_HORIZON = 180   # Seconds an estimate is counted down before it must be re-fetched
+POLL_MAX_AGE = 10       # Cached data a watch poll may still reuse, in seconds
+
+
+def poll_interval(arrivals: List[BusArrival], horizon: float = DEFAULT_HORIZON) -> float:
+    """
+    Seconds to wait before polling a stop again.
+
+    Polls fast while the nearest bus is a few minutes away, where estimates
+    move quickly and a stale number is most noticeable, and back off when
+    the next bus is far off or the stop is empty.
+
+    Args:
+        arrivals: The latest arrivals for the stop
+        horizon: Never wait longer than this
+
+    Returns:
+        Delay in seconds
+    """
+    if not arrivals:
+        return min(horizon, EMPTY_INTERVAL)
+    soonest = min(a.estimated_minutes for a in arrivals)
+    return min(horizon, max(MIN_INTERVAL, min(MAX_INTERVAL, soonest * INTERVAL_PER_MINUTE)))
+
+
+def project(arrivals: List[BusArrival], now: Optional[float] = None) -> List[BusArrival]:
+    """
+    Arrivals as they should read at `now`, soonest first.
+
+    Args:
+        arrivals: Arrivals stamped with their fetch time
+        now: Unix time to project to (defaults to the current time)
+
+    Returns:
+        Copies with estimated_minutes counted down (never below 0)
+    """
+    now = now or time.time()
+    return sorted((a.projected(now) for a in arrivals), key=lambda a: a.estimated_minutes)
@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+"""
+Thread-Safety Stress Test
+=========================
+Hammers one shared OasthAPI from many threads against a local stand-in for
+the OASTH API that rotates its CSRF token every few hundred requests.
+
+Checks that:
+  - every request succeeds and gets the answer for its own stop code
+  - each token rotation causes exactly one session refresh, however many
+    threads hit the 401 at once
+  - the connection pool is big enough that connections are reused rather
+    than opened and dropped
+
+Usage:
+    python stress_threads.py
+    python stress_threads.py --threads 64 --requests 20000 --rotate-every 500
+    python stress_threads.py --transport httpx
+"""
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+
+class StandIn(ThreadingHTTPServer):
+    """Minimal OASTH API double: checks the token, rotates it, echoes the stop"""
+
+    daemon_threads = True
+
+    def __init__(self, rotate_every: int):
+        super().__init__(('127.0.0.1', 0), _Handler)
+        self.rotate_every = rotate_every
+        self.lock = threading.Lock()
+        self.generation = 0
+        self.served = 0
+        self.unauthorized = 0
+        self.connections = 0
+
+    @property
+    def token(self) -> str:
+        return f"token-{self.generation}"
+
+    def check(self, token: str) -> bool:
+        """Count a request; False if its token is not the current one"""
+        with self.lock:
+            if token != self.token:
+                self.unauthorized += 1
+                return False
+            self.served += 1
+            if self.served % self.rotate_every == 0:
+                self.generation += 1
+            return True
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # Keep-alive, like the real server
+
+    def setup(self):
+        super().setup()
+        with self.server.lock:
+            self.server.connections += 1
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        query = parse_qs(urlparse(self.path).query)
+        if not self.server.check(self.headers.get('X-CSRF-Token')):
+            self._reply(401, {'error': 'unauthorized'})
+            return
+        stop = query.get('p1', [''])[0]
+        self._reply(200, [{'bline_id': stop, 'route_code': '1', 'veh_code': stop, 'btime2': '5'}])
+
+    def _reply(self, status: int, body):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[3])
+    parser.add_argument('--threads', type=int, default=32)
+    parser.add_argument('--requests', type=int, default=5000)
+    parser.add_argument('--stops', type=int, default=500, help='Distinct stop codes')
+    parser.add_argument('--rotate-every', type=int, default=300,
+                        help='Requests served per token')
+    parser.add_argument('--transport', choices=['requests', 'httpx'], default='requests')
+    args = parser.parse_args()
+
+    # Keep the session files of this run away from the real ones
+    tmp = tempfile.TemporaryDirectory()
+    os.environ['XDG_CACHE_HOME'] = tmp.name
+    from core.api import OasthAPI
+    from core.resilience import Resilience
+    from core.session import SessionData
+    from core.transport import HttpxTransport, RequestsTransport
+
+    server = StandIn(args.rotate_every)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    refreshes = []
+
+    def session_factory(force_refresh: bool = False, stale=None) -> SessionData:
+        refreshes.append(force_refresh)
+        return SessionData(phpsessid='stress', token=server.token, created_at=time.time())
+
+    api = OasthAPI(
+        session_data=session_factory(),
+        base_url=f"http://127.0.0.1:{server.server_address[1]}/api/",
+        pool_size=args.threads,
+        resilience=Resilience(default_rate=(1e9, 1e9)),
+        session_factory=session_factory,
+        transport=(HttpxTransport if args.transport == 'httpx' else RequestsTransport)(args.threads),
+    )
+    refreshes.clear()
+
+    latencies = []
+    mismatches = []
+
+    def one(i: int):
+        stop = str(i % args.stops)
+        start = time.perf_counter()
+        arrivals = api.get_arrivals(stop)
+        latencies.append(time.perf_counter() - start)
+        if [a.line_id for a in arrivals] != [stop]:
+            mismatches.append(stop)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.threads) as pool:
+        errors = [f.exception() for f in [pool.submit(one, i) for i in range(args.requests)]]
+    elapsed = time.perf_counter() - started
+    server.shutdown()
+
+    errors = [e for e in errors if e is not None]
+    rotations = server.generation
+    forced = sum(refreshes)
+    latencies.sort()
+
+    print(f"{args.requests} requests on {args.threads} threads in {elapsed:.2f}s "
+          f"({args.requests / elapsed:.0f}/s)")
+    print(f"latency p50 {statistics.median(latencies) * 1000:.1f} ms, "
+          f"p99 {latencies[int(len(latencies) * 0.99)] * 1000:.1f} ms")
+    print(f"upstream {server.served} served, {server.unauthorized} x 401, "
+          f"{api.metrics.coalesced} coalesced")
+    print(f"token rotations {rotations}, session refreshes {forced}, "
+          f"session version {api.session_version}")
+    print(f"connections opened {server.connections} (pool size {api.pool_size})")
+
+    failed = []
+    if errors:
+        failed.append(f"{len(errors)} requests failed, e.g. {errors[0]!r}")
+    if mismatches:
+        failed.append(f"{len(mismatches)} answers for the wrong stop")
+    if forced > rotations:
+        failed.append(f"{forced - rotations} duplicate session refreshes")
+    if server.connections > args.threads:
+        failed.append("connection pool too small, connections were dropped")
+    for message in failed:
+        print(f"❌ {message}")
+    tmp.cleanup()
+    if failed:
+        sys.exit(1)
+    print("✅ Thread-safe")
+
+
+if __name__ == "__main__":
+    main()
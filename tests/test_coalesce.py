@@ -0,0 +1,150 @@
+"""
+Tests for core.coalesce
+=======================
+Run from the repository root: python -m pytest tests
+"""
+
+import asyncio
+import threading
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+from core.coalesce import Coalescer, request_key
+
+
+class SlowCall:
+    """Blocking call that counts how often it actually runs"""
+
+    def __init__(self, delay: float = 0.2, error: BaseException = None):
+        self.delay = delay
+        self.error = error
+        self.runs = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, value='ok'):
+        with self._lock:
+            self.runs += 1
+        time.sleep(self.delay)
+        if self.error is not None:
+            raise self.error
+        return value
+
+
+class CoalescerTest(unittest.TestCase):
+
+    def test_request_key_ignores_parameter_order(self):
+        self.assertEqual(request_key('a', {'p1': 1, 'p2': 2}), request_key('a', {'p2': 2, 'p1': 1}))
+        self.assertNotEqual(request_key('a', {'p1': 1}), request_key('a', {'p1': 1}, 'POST'))
+
+    def test_threads_share_one_call_per_key(self):
+        coalescer = Coalescer()
+        call = SlowCall()
+        barrier = threading.Barrier(100)
+
+        def worker(i: int):
+            stop = str(i % 5)
+            barrier.wait()
+            return coalescer.call(('stop', stop), lambda: call(stop))
+
+        with ThreadPoolExecutor(max_workers=100) as pool:
+            results = list(pool.map(worker, range(100)))
+
+        self.assertEqual(results, [str(i % 5) for i in range(100)])
+        self.assertEqual(call.runs, 5)
+        self.assertEqual(coalescer.calls, 100)
+        self.assertEqual(coalescer.shared, 95)
+
+    def test_key_is_forgotten_after_the_call(self):
+        coalescer = Coalescer()
+        call = SlowCall(delay=0)
+        coalescer.call('k', call)
+        coalescer.call('k', call)
+        self.assertEqual(call.runs, 2)
+
+    def test_error_reaches_every_waiter(self):
+        coalescer = Coalescer()
+        call = SlowCall(error=ValueError('boom'))
+        barrier = threading.Barrier(20)
+
+        def worker(_):
+            barrier.wait()
+            try:
+                coalescer.call('k', call)
+            except ValueError as e:
+                return str(e)
+
+        with ThreadPoolExecutor(max_workers=20) as pool:
+            results = list(pool.map(worker, range(20)))
+
+        self.assertEqual(results, ['boom'] * 20)
+        self.assertEqual(call.runs, 1)
+
+    def test_tasks_share_one_call_per_key(self):
+        coalescer = Coalescer()
+        call = SlowCall()
+
+        async def main():
+            with ThreadPoolExecutor(max_workers=4) as executor:
+                return await asyncio.gather(*(
+                    coalescer.acall(('stop', str(i % 3)), lambda i=i: call(str(i % 3)), executor)
+                    for i in range(60)))
+
+        results = asyncio.run(main())
+        self.assertEqual(results, [str(i % 3) for i in range(60)])
+        self.assertEqual(call.runs, 3)
+
+    def test_cancelled_leader_does_not_cancel_joined_tasks(self):
+        coalescer = Coalescer()
+        call = SlowCall()
+
+        async def main():
+            leader = asyncio.ensure_future(coalescer.acall('k', call))
+            await asyncio.sleep(0.05)  # Leader's call is running on a thread
+            follower = asyncio.ensure_future(coalescer.acall('k', call))
+            await asyncio.sleep(0.05)
+            leader.cancel()
+            result = await follower
+            with self.assertRaises(asyncio.CancelledError):
+                await leader
+            return result
+
+        self.assertEqual(asyncio.run(main()), 'ok')
+        self.assertEqual(call.runs, 1)
+
+    def test_cancelled_follower_does_not_cancel_the_call(self):
+        coalescer = Coalescer()
+        call = SlowCall()
+
+        async def main():
+            leader = asyncio.ensure_future(coalescer.acall('k', call))
+            await asyncio.sleep(0.05)
+            follower = asyncio.ensure_future(coalescer.acall('k', call))
+            await asyncio.sleep(0.05)
+            follower.cancel()
+            return await leader
+
+        self.assertEqual(asyncio.run(main()), 'ok')
+        self.assertEqual(call.runs, 1)
+
+    def test_thread_joins_an_async_call(self):
+        coalescer = Coalescer()
+        call = SlowCall()
+        joined = []
+
+        async def main():
+            task = asyncio.ensure_future(coalescer.acall('k', call))
+            await asyncio.sleep(0.05)
+            thread = threading.Thread(target=lambda: joined.append(coalescer.call('k', call)))
+            thread.start()
+            result = await task
+            await asyncio.get_running_loop().run_in_executor(None, thread.join)
+            return result
+
+        self.assertEqual(asyncio.run(main()), 'ok')
+        self.assertEqual(joined, ['ok'])
+        self.assertEqual(call.runs, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
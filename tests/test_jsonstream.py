@@ -0,0 +1,53 @@
+"""
+Tests for core.jsonstream
+=========================
+Run from the repository root: python -m pytest tests
+"""
+
+import json
+import unittest
+
+from core.jsonstream import iter_json_array
+
+
+# Numbers in every shape the grammar allows, so some chunk boundary falls
+# after each of "-", ".", "e", "E", "+" and between digits
+BODY = (
+    '[-4.5, 12, 0, -0.25, 1e3, 2E-2, -7.125e+10, 3.0, '
+    '{"StopLat": "40.63", "lng": 22.94, "n": -12}, true, null, "Ευκαρπία", '
+    '[1.5, -2e1], 123456789, -1]'
+)
+
+
+def chunked(data: bytes, size: int):
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+class IterJsonArrayTest(unittest.TestCase):
+
+    def test_every_chunk_size(self):
+        data = BODY.encode('utf-8')
+        expected = json.loads(BODY)
+        for size in range(1, len(data) + 1):
+            with self.subTest(size=size):
+                self.assertEqual(list(iter_json_array(chunked(data, size))), expected)
+
+    def test_number_split_after_sign_dot_and_exponent(self):
+        for body in ('[-4.5]', '[1e3]', '[2.5E-2]', '[-7e+1]', '[10]'):
+            data = body.encode()
+            for cut in range(1, len(data)):
+                with self.subTest(body=body, cut=cut):
+                    self.assertEqual(list(iter_json_array([data[:cut], data[cut:]])),
+                                     json.loads(body))
+
+    def test_not_an_array(self):
+        self.assertEqual(list(iter_json_array([b'null'])), [])
+        self.assertEqual(list(iter_json_array([b'{"error": 1}'])), [])
+
+    def test_invalid_number(self):
+        with self.assertRaises(json.JSONDecodeError):
+            list(iter_json_array([b'[-4.', b']']))
+
+
+if __name__ == '__main__':
+    unittest.main()